@@ -3,6 +3,58 @@
 import ipywidgets as ipw
 import traitlets
 
+from .index import INDEX_PATH, ElnIndex
+from .picker import ElnEntryPicker
+from .profiling import ProfiledLimiter, default_profile_directory
+from .throttle import get_limiter
+
+
+def _child_widgets(widget):
+    """Widgets contained in a widget: its children, layout, style and attributes."""
+    values = [*getattr(widget, "children", ()), getattr(widget, "layout", None)]
+    values.append(getattr(widget, "style", None))
+    for value in vars(widget).values():
+        if isinstance(value, (list, tuple)):
+            values.extend(value)
+        elif isinstance(value, dict):
+            values.extend(value.values())
+        else:
+            values.append(value)
+    return [value for value in values if isinstance(value, ipw.Widget)]
+
+
+def _widget_registry():
+    # ipywidgets 8 moved the registry of the open widgets.
+    registry = getattr(ipw.widgets.widget, "_instances", None)
+    return ipw.Widget.widgets if registry is None else registry
+
+
+def _close_widgets(widgets, closed):
+    stack = list(widgets)
+    while stack:
+        widget = stack.pop()
+        if id(widget) in closed:
+            continue
+        closed.add(id(widget))
+        stack.extend(_child_widgets(widget))
+        widget.close()
+
+    for link in list(_widget_registry().values()):
+        if isinstance(link, ipw.widgets.widget_link.Link) and any(
+            id(end[0]) in closed for end in (link.source, link.target) if end
+        ):
+            link.close()
+
+
+def close_widget_tree(widget):
+    """Close a widget together with all the widgets it contains.
+
+    Besides the children, this closes the layout and style widgets, the widgets
+    stored as attributes and the links between the closed widgets, which `close`
+    leaves open.
+    """
+    _close_widgets([widget], set())
+
 
 class ElnConnector(ipw.VBox):
     """Base class for the ELN connectors."""
@@ -10,6 +62,13 @@ class ElnConnector(ipw.VBox):
     aiidalab_instance = traitlets.Unicode()
     eln_instance = traitlets.Unicode()
     eln_type = traitlets.Unicode()
+    max_concurrency = traitlets.Int(4)
+    max_request_rate = traitlets.Float(10.0)
+    index_path = traitlets.Unicode(INDEX_PATH)
+    # Directory for cProfile statistics of the connector operations, empty to disable.
+    profile_directory = traitlets.Unicode()
+    # Kind of the index entries whose identifier is stored in `sample_uuid`.
+    sample_picker_kind = "sample"
 
     def __init__(self, **kwargs):
         """Connect to an ELN
@@ -17,9 +76,80 @@ class ElnConnector(ipw.VBox):
         Args:
             eln_instance (str): URL which points to the ELN instance.
             eln_type (str): ELN type, e.g. "cheminfo" or "openbis".
+            max_concurrency (int): Maximum number of concurrent requests to the ELN.
+            max_request_rate (float): Maximum number of requests per second to the ELN.
+            index_path (str): Path of the local index of the ELN entries.
+            profile_directory (str): Directory where the operations are profiled to,
+                defaults to the AIIDALAB_ELN_PROFILE_DIR environment variable.
         """
+        self._sample_picker = None
         super().__init__(**kwargs)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def release_session(self):
+        """Release the current ELN session, e.g. before connecting again."""
+        self.session = None
+
+    def close(self):
+        """Release the ELN session and close all the widgets of the connector."""
+        self.release_session()
+        _close_widgets(_child_widgets(self), {id(self)})
+        self._sample_picker = None
+        super().close()
+
+    @traitlets.default("profile_directory")
+    def _default_profile_directory(self):  # pylint: disable=no-self-use
+        return default_profile_directory()
+
+    @property
+    def limiter(self):
+        """Rate limiter shared by all connectors talking to the same ELN instance."""
+        limiter = get_limiter(
+            self.eln_instance,
+            max_concurrency=self.max_concurrency,
+            max_rate=self.max_request_rate,
+        )
+        if self.profile_directory:
+            return ProfiledLimiter(limiter, self.profile_directory)
+        return limiter
+
+    @property
+    def index(self):
+        """Local searchable index of the entries of the ELN instance."""
+        return ElnIndex(self.eln_instance, path=self.index_path)
+
+    @property
+    def sample_picker(self):
+        """Widget to pick an entry from the local index, linked to `sample_uuid`."""
+        if self._sample_picker is None:
+            self._sample_picker = ElnEntryPicker(
+                self.index, refresh=self.refresh_index, kind=self.sample_picker_kind
+            )
+            traitlets.dlink(
+                (self._sample_picker, "value"),
+                (self, "sample_uuid"),
+                transform=lambda value: value or "",
+            )
+        return self._sample_picker
+
+    @traitlets.observe("eln_instance", "index_path")
+    def _observe_index(self, _=None):
+        # Point the picker to the index of the new ELN instance.
+        if getattr(self, "_sample_picker", None) is not None:
+            self._sample_picker.index = self.index
+            self._sample_picker.page = 0
+            self._sample_picker.update()
+
+    def refresh_index(self):
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not implement the 'refresh_index' method"
+        )
+
     def connect(self):
         raise NotImplementedError(
             f"{self.__class__.__name__} does not implement the 'connect' method"
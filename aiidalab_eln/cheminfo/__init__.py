@@ -1,5 +1,6 @@
 """Module to define the Cheminfo ELN connector for AiiDAlab."""
 
+import logging
 import pathlib
 
 import ipywidgets as ipw
@@ -9,9 +10,24 @@ from cheminfopy import User, errors
 from IPython.display import Javascript, display
 
 from ..base_connector import ElnConnector
-from .exporter import export_cif, export_isotherm
+from ..profiling import profiled
+from ..throttle import ThrottledProxy
+from .exporter import export_cif, export_isotherm, export_isotherms
 from .importer import import_cif, import_pdb
 
+# Methods of the cheminfopy requester that send requests to the ELN. They are
+# throttled there rather than on the managers, since e.g. `User.has_rights` and
+# `User.is_valid_token` turn any HTTP error into `False`, which would hide overload
+# responses from the limiter. Creating a manager also sends a request to check the
+# instance URL, so managers are created through the limiter as well.
+REQUEST_NETWORK_METHODS = ("get", "get_file", "put", "delete")
+
+
+def _drop_duplicate_request_log_handlers():
+    """Remove the log handlers cheminfopy adds again for every request object."""
+    # Otherwise they accumulate in long-lived kernels.
+    del logging.getLogger("ELNRequestLogger").handlers[1:]
+
 
 class CheminfoElnConnector(ElnConnector):
     """Cheminfo ELN connector to AiiDAlab."""
@@ -21,6 +37,8 @@ class CheminfoElnConnector(ElnConnector):
     sample_uuid = traitlets.Unicode()
     file_name = traitlets.Unicode()
     data_type = traitlets.Unicode()
+    # Write isotherms in the compressed JCAMP-DX form.
+    compress_jcamp = traitlets.Bool(False)
 
     def __init__(self, **kwargs):
         self.session = None
@@ -76,19 +94,45 @@ class CheminfoElnConnector(ElnConnector):
             **kwargs,
         )
 
+    @profiled
     def connect(self):
         """Connect to the cheminfo ELN."""
+        self.release_session()
         try:
-            self.session = User(instance=self.eln_instance, token=self.token)
+            self.session = self._throttle(
+                self.limiter.call(User, instance=self.eln_instance, token=self.token)
+            )
             return ""
         except errors.InvalidInstanceUrlError:
             return "The ELN address seems to be wrong."
 
+    def release_session(self):
+        """Drop the cheminfo session and the log handlers of its requests."""
+        _drop_duplicate_request_log_handlers()
+        super().release_session()
+
+    def _throttle(self, manager):
+        """Route the requests of a cheminfopy manager through the ELN limiter."""
+        manager.requester = ThrottledProxy(
+            manager.requester, self.limiter, REQUEST_NETWORK_METHODS
+        )
+        _drop_duplicate_request_log_handlers()
+        return manager
+
+    def _get_sample(self):
+        return self._throttle(
+            self.limiter.call(self.session.get_sample, self.sample_uuid)
+        )
+
     def get_config(self):
         return {
             "eln_instance": self.eln_instance,
             "eln_type": self.eln_type,
             "token": self.token,
+            "max_concurrency": self.max_concurrency,
+            "max_request_rate": self.max_request_rate,
+            "compress_jcamp": self.compress_jcamp,
+            "index_path": self.index_path,
         }
 
     def request_token(self, _=None):
@@ -120,14 +164,37 @@ class CheminfoElnConnector(ElnConnector):
         return ipw.VBox(
             [
                 self.sample_uuid_widget,
+                self.sample_picker,
                 self.file_name_widget,
             ]
         )
 
+    @profiled
+    def refresh_index(self):
+        """Update the local index with the table of contents of the user's samples.
+
+        The ELN only provides the whole table of contents, so the delta is computed
+        locally and only the changed entries are written to the index.
+        """
+        entries = []
+        for row in self.session.get_sample_toc():
+            value = row.get("value") or {}
+            entries.append(
+                {
+                    "identifier": row["id"],
+                    "name": value.get("reference") or str(row.get("key", "")),
+                    "properties": value,
+                    "attachments": value.get("spectra") or [],
+                    "modified": value.get("modificationDate"),
+                }
+            )
+        self.index.upsert("sample", entries)
+
+    @profiled
     def export_data(self):
         """Export AiiDA object (node attribute of this class) to ELN."""
 
-        sample = self.session.get_sample(self.sample_uuid)
+        sample = self._get_sample()
 
         # Choose the data type.
         if self.node.node_type == "data.dict.Dict.":
@@ -136,6 +203,7 @@ class CheminfoElnConnector(ElnConnector):
                 self.node,
                 self.file_name,
                 aiidalab_instance=self.aiidalab_instance,
+                compress=self.compress_jcamp,
             )
         elif self.node.node_type == "data.cif.CifData.":
             export_cif(
@@ -145,9 +213,21 @@ class CheminfoElnConnector(ElnConnector):
                 aiidalab_instance=self.aiidalab_instance,
             )
 
+    @profiled
+    def export_isotherms(self, nodes):
+        """Export several isotherms (Dict nodes) to the ELN as a single file."""
+        sample = self._get_sample()
+        export_isotherms(
+            sample,
+            nodes,
+            self.file_name or None,
+            aiidalab_instance=self.aiidalab_instance,
+        )
+
+    @profiled
     def import_data(self):
         """Import data object from cheminfo ELN to AiiDAlab."""
-        sample = self.session.get_sample(self.sample_uuid)
+        sample = self._get_sample()
         fpath = pathlib.Path(self.file_name)
 
         # Choose the data type.
@@ -4,52 +4,79 @@ from aiida import orm
 from aiida.plugins import WorkflowFactory
 from pytojcamp import from_dict
 
+from .jcamp import link_file, xy_block
+
+
+def _get_adsorptive(node):
+    """Get the adsorptive of the isotherm workchain that created the node."""
+    # Workaround till the Isotherm object is not ready.
+    isotherm_wf = WorkflowFactory("lsmo.isotherm")
+    query = (
+        orm.QueryBuilder()
+        .append(orm.Dict, filters={"uuid": node.uuid}, tag="isotherm_data")
+        .append(isotherm_wf, with_outgoing="isotherm_data", tag="isotherm_wf")
+        .append(orm.Str, with_outgoing="isotherm_wf", project="attributes.value")
+    )
+    adsorptive = query.all(flat=True)
+    return adsorptive[0] if adsorptive else None
+
+
+def _isotherm_block(node, meta, block_id=None):
+    """Write the isotherm stored in the node as a compressed JCAMP-DX block."""
+    return xy_block(
+        node["isotherm"]["pressure"],
+        node["isotherm"]["loading_absolute_average"],
+        x_unit=node["isotherm"]["pressure_unit"],
+        y_unit=node["isotherm"]["loading_absolute_unit"],
+        title=f"{meta['adsorptive']} at {meta['temperature']} K",
+        data_type="Adsorption Isotherm",
+        meta=meta,
+        block_id=block_id,
+    )
+
 
 def export_isotherm(
     sample,
     node,
     file_name: str = None,
     aiidalab_instance: str = "unknown",
+    compress: bool = False,
 ):
-    """Export Isotherm object."""
+    """Export Isotherm object.
+
+    With `compress`, the data is written in the compressed JCAMP-DX form instead of
+    a plain XY table.
+    """
     source_info = {
         "uuid": node.uuid,
         "url": aiidalab_instance,
         "name": "Isotherm simulated using the isotherm app on AiiDAlab",
     }
 
-    # Workaround till the Isotherm object is not ready.
-    isotherm_wf = WorkflowFactory("lsmo.isotherm")
-    query = (
-        orm.QueryBuilder()
-        .append(orm.Dict, filters={"uuid": node.uuid}, tag="isotherm_data")
-        .append(isotherm_wf, with_outgoing="isotherm_data", tag="isotherm_wf")
-        .append(orm.Str, with_outgoing="isotherm_wf", project="attributes.value")
-    )
-    adsorptive = query.all(flat=True)
-    adsorptive = adsorptive[0] if adsorptive else None
-
     meta = {
-        "adsorptive": adsorptive,
+        "adsorptive": _get_adsorptive(node),
         "temperature": node["temperature"],
         "method": "GCMC",
     }
-    jcamp = from_dict(
-        {
-            "x": {
-                "data": node["isotherm"]["pressure"],
-                "unit": node["isotherm"]["pressure_unit"],
-                "type": "INDEPENDENT",
+    if compress:
+        jcamp = _isotherm_block(node, meta)
+    else:
+        jcamp = from_dict(
+            {
+                "x": {
+                    "data": node["isotherm"]["pressure"],
+                    "unit": node["isotherm"]["pressure_unit"],
+                    "type": "INDEPENDENT",
+                },
+                "y": {
+                    "data": node["isotherm"]["loading_absolute_average"],
+                    "unit": node["isotherm"]["loading_absolute_unit"],
+                    "type": "DEPENDENT",
+                },
             },
-            "y": {
-                "data": node["isotherm"]["loading_absolute_average"],
-                "unit": node["isotherm"]["loading_absolute_unit"],
-                "type": "DEPENDENT",
-            },
-        },
-        data_type="Adsorption Isotherm",
-        meta=meta,
-    )
+            data_type="Adsorption Isotherm",
+            meta=meta,
+        )
     sample.put_data(
         data_type="isotherm",
         file_name=f"{node.uuid}.jcamp" if file_name is None else f"{file_name}.jcamp",
@@ -59,6 +86,44 @@ def export_isotherm(
     )
 
 
+def export_isotherms(
+    sample,
+    nodes,
+    file_name: str = None,
+    aiidalab_instance: str = "unknown",
+):
+    """Export several Isotherm objects as a single multi-block JCAMP-DX file.
+
+    Each isotherm, e.g. for a different temperature or adsorptive, is written as a
+    compressed block of one LINK file, so that a whole campaign is a single upload.
+    """
+    source_info = {
+        "uuid": ",".join(node.uuid for node in nodes),
+        "url": aiidalab_instance,
+        "name": "Isotherms simulated using the isotherm app on AiiDAlab",
+    }
+
+    blocks = []
+    for block_id, node in enumerate(nodes, start=1):
+        meta = {
+            "adsorptive": _get_adsorptive(node),
+            "temperature": node["temperature"],
+            "method": "GCMC",
+        }
+        blocks.append(_isotherm_block(node, meta, block_id=block_id))
+
+    jcamp = link_file(blocks, title="Adsorption Isotherms")
+    sample.put_data(
+        data_type="isotherm",
+        file_name=(
+            f"{nodes[0].uuid}.jcamp" if file_name is None else f"{file_name}.jcamp"
+        ),
+        file_content=jcamp,
+        metadata={"method": "GCMC"},
+        source_info=source_info,
+    )
+
+
 def export_cif(
     sample,
     node,
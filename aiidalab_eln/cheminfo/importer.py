@@ -3,7 +3,8 @@
 import io
 
 from aiida.plugins import DataFactory
-from ase.io import read
+
+from .structure import parse_pdb, structure_from_arrays
 
 
 def import_cif(sample, **kwargs):
@@ -17,8 +18,6 @@ def import_cif(sample, **kwargs):
 
 def import_pdb(sample, **kwargs):
     """Import PDB object from sample in cheminfo ELN to AiiDA node."""
-    object_type = DataFactory("structure")
     file_content = sample.get_data(data_type="xray", file_name=kwargs["file_name"])
-    file_object = io.BytesIO(bytes(file_content, "utf8"))
-    node = object_type(from_ase=read(file_object))
+    node = structure_from_arrays(**parse_pdb(file_content))
     return node
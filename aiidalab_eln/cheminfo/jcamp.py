@@ -0,0 +1,159 @@
+"""Module to write compact and multi-block JCAMP-DX files."""
+
+import math
+
+import numpy as np
+
+MAX_LINE_LENGTH = 80
+SQZ_POSITIVE = "@ABCDEFGHI"
+SQZ_NEGATIVE = "@abcdefghi"
+DIF_POSITIVE = "%JKLMNOPQR"
+DIF_NEGATIVE = "%jklmnopqr"
+DUP = "STUVWXYZs"
+
+
+def _encode(value, positive, negative):
+    """Replace the leading digit (and the sign) of an integer by a pseudo-digit."""
+    digits = str(abs(value))
+    table = negative if value < 0 else positive
+    return table[int(digits[0])] + digits[1:]
+
+
+def _dup(count):
+    digits = str(count)
+    return DUP[int(digits[0]) - 1] + digits[1:]
+
+
+def _format_number(value, significant_digits):
+    return f"{value:.{significant_digits}g}"
+
+
+def _difdup_lines(x_values, y_integers, significant_digits):
+    """Encode integer ordinates in DIFDUP form, with the Y-check at each line start."""
+    differences = [
+        _encode(second - first, DIF_POSITIVE, DIF_NEGATIVE)
+        for first, second in zip(y_integers[:-1], y_integers[1:])
+    ]
+    # The abscissas must not use the exponent notation, since "e" is a pseudo-digit.
+    x_strings = [
+        np.format_float_positional(
+            value, precision=significant_digits, fractional=False, trim="-"
+        )
+        for value in x_values
+    ]
+    lines = []
+    index = 0
+    while index < len(differences):
+        # Each line starts with the last ordinate of the previous one.
+        line = x_strings[index]
+        line += _encode(y_integers[index], SQZ_POSITIVE, SQZ_NEGATIVE)
+        start = len(line)
+        while index < len(differences):
+            token = differences[index]
+            count = 1
+            while (
+                index + count < len(differences) and differences[index + count] == token
+            ):
+                count += 1
+            token += _dup(count) if count > 1 else ""
+            if len(line) + len(token) > MAX_LINE_LENGTH and len(line) > start:
+                break
+            line += token
+            index += count
+        lines.append(line)
+
+    # Final Y-check line.
+    lines.append(x_strings[-1] + _encode(y_integers[-1], SQZ_POSITIVE, SQZ_NEGATIVE))
+    return lines
+
+
+def _is_equidistant(values):
+    if len(values) < 3:
+        return False
+    steps = np.diff(values)
+    return bool(np.allclose(steps, steps[0], rtol=1e-6, atol=0))
+
+
+def _factor(values, significant_digits):
+    """Choose a power of ten that keeps `significant_digits` when stored as integers."""
+    maximum = float(np.max(np.abs(values)))
+    if maximum == 0:
+        return 1.0
+    return 10.0 ** (math.floor(math.log10(maximum)) - significant_digits + 1)
+
+
+def xy_block(
+    x_values,
+    y_values,
+    x_unit,
+    y_unit,
+    title="",
+    data_type="",
+    meta=None,
+    significant_digits=6,
+    block_id=None,
+):
+    """Write a single XY JCAMP-DX block with compressed data.
+
+    Equally spaced abscissas are written as (X++(Y..Y)) in DIFDUP form, all other
+    data as an (XY..XY) table with compactly formatted numbers.
+
+    Args:
+        x_values (list): Abscissa values.
+        y_values (list): Ordinate values.
+        x_unit (str): Unit of the abscissa.
+        y_unit (str): Unit of the ordinate.
+        title (str): Title of the block.
+        data_type (str): Data type of the block, e.g. "Adsorption Isotherm".
+        meta (dict): Additional metadata written as user-defined labels.
+        significant_digits (int): Number of significant digits that are kept.
+        block_id (int): Block identifier, if the block is part of a LINK file.
+    Returns:
+        str: JCAMP-DX block.
+    """
+    x_values = np.asarray(x_values, dtype=float)
+    y_values = np.asarray(y_values, dtype=float)
+
+    header = [f"##TITLE={title}", "##JCAMP-DX=5.01"]
+    if block_id is not None:
+        header.append(f"##BLOCK_ID={block_id}")
+    header += [
+        f"##DATA TYPE={data_type}",
+        f"##XUNITS={x_unit}",
+        f"##YUNITS={y_unit}",
+        f"##NPOINTS={len(x_values)}",
+        f"##FIRSTX={_format_number(x_values[0], significant_digits)}",
+        f"##LASTX={_format_number(x_values[-1], significant_digits)}",
+    ]
+    header += [f"##${key}={value}" for key, value in (meta or {}).items()]
+
+    if _is_equidistant(x_values):
+        y_factor = _factor(y_values, significant_digits)
+        y_integers = [int(value) for value in np.rint(y_values / y_factor)]
+        header += [
+            "##XFACTOR=1",
+            f"##YFACTOR={y_factor:g}",
+            f"##FIRSTY={_format_number(y_values[0], significant_digits)}",
+            f"##DELTAX={_format_number(x_values[1] - x_values[0], significant_digits)}",
+            "##XYDATA=(X++(Y..Y))",
+        ]
+        data = _difdup_lines(x_values, y_integers, significant_digits)
+    else:
+        header.append("##XYPOINTS=(XY..XY)")
+        data = [
+            f"{_format_number(x, significant_digits)},"
+            f"{_format_number(y, significant_digits)}"
+            for x, y in zip(x_values, y_values)
+        ]
+    return "\n".join(header + data + ["##END="]) + "\n"
+
+
+def link_file(blocks, title=""):
+    """Combine several JCAMP-DX blocks into one multi-block LINK file."""
+    header = [
+        f"##TITLE={title}",
+        "##JCAMP-DX=5.01",
+        "##DATA TYPE=LINK",
+        f"##BLOCKS={len(blocks)}",
+    ]
+    return "\n".join(header) + "\n" + "".join(blocks) + "##END=\n"
@@ -0,0 +1,122 @@
+"""Module to build large StructureData nodes from PDB files in bulk."""
+
+import numpy as np
+from aiida import orm
+from aiida.orm.nodes.data.structure import Kind
+from ase.cell import Cell
+from ase.data import atomic_masses, atomic_numbers
+from ase.io.espresso import label_to_symbol
+
+
+def _symbol(element, name):
+    """Chemical symbol of a PDB atom, as ASE reads it."""
+    try:
+        return label_to_symbol(element.strip().upper())
+    except (KeyError, IndexError):
+        return label_to_symbol(name.strip())
+
+
+def parse_pdb(content):
+    """Read the last model of a PDB file into NumPy arrays.
+
+    The atoms are parsed the same way as by `ase.io.read`, but the coordinates and
+    symbols are converted for all atoms at once instead of atom by atom.
+    Args:
+        content (str): Content of the PDB file.
+    Returns:
+        dict: Cell, periodic boundary conditions, positions and symbols.
+    """
+    origin = np.identity(3)
+    translation = np.zeros(3)
+    frame = {"atoms": [], "cell": None}
+    last_frame = frame
+    for line in content.splitlines():
+        if line.startswith(("ATOM", "HETATM")):
+            frame["atoms"].append(line)
+        elif line.startswith("CRYST1"):
+            frame["cell"] = [
+                float(line[start:end])
+                for start, end in zip((6, 15, 24, 33, 40, 47), (15, 24, 33, 40, 47, 54))
+            ]
+        elif line.startswith("ORIGX"):
+            row = int(line[5]) - 1
+            origin[row] = [float(line[10:20]), float(line[20:30]), float(line[30:40])]
+            translation[row] = float(line[45:55])
+        elif line.startswith("END"):
+            # End of a model, keep the last one that contains atoms.
+            if frame["atoms"]:
+                last_frame = frame
+            frame = {"atoms": [], "cell": None}
+    if frame["atoms"]:
+        last_frame = frame
+
+    lines = last_frame["atoms"]
+    try:
+        positions = np.array(
+            [(line[30:38], line[38:46], line[46:54]) for line in lines], dtype=float
+        ).reshape(-1, 3)
+    except ValueError as error:
+        raise ValueError("Invalid or missing coordinate(s)") from error
+    positions = positions @ origin.T + translation
+
+    # Proteins consist of few distinct atom labels, so only those are converted.
+    labels = np.array([(line[76:78], line[12:16]) for line in lines], dtype=str)
+    unique_labels, inverse = np.unique(
+        labels.reshape(-1, 2), axis=0, return_inverse=True
+    )
+    unique_symbols = np.array(
+        [_symbol(element, name) for element, name in unique_labels], dtype=str
+    )
+
+    cell = last_frame["cell"]
+    return {
+        "cell": np.zeros((3, 3)) if cell is None else Cell.new(cell).array,
+        "pbc": np.full(3, cell is not None),
+        "positions": positions,
+        "symbols": unique_symbols[inverse.reshape(-1)],
+    }
+
+
+def structure_from_arrays(symbols, positions, cell, pbc):
+    """Create a StructureData node from NumPy arrays without appending atom by atom.
+
+    The kinds and sites are written to the node attributes in one go and are the
+    same as those created by `StructureData(ase=...)`: one kind per element, with
+    the ASE atomic mass.
+    Args:
+        symbols (ndarray): Chemical symbol of every atom.
+        positions (ndarray): Cartesian positions of the atoms, in Angstrom.
+        cell (ndarray): Cell vectors, in Angstrom.
+        pbc (ndarray): Periodic boundary conditions along the cell vectors.
+    Returns:
+        StructureData: AiiDA structure.
+    """
+    # Kinds ordered by first appearance, as when the atoms are appended one by one.
+    unique_symbols, first_index, inverse = np.unique(
+        symbols, return_index=True, return_inverse=True
+    )
+    order = np.argsort(first_index)
+    kinds = [
+        Kind(
+            symbols=str(symbol),
+            name=str(symbol),
+            mass=float(atomic_masses[atomic_numbers[str(symbol)]]),
+        ).get_raw()
+        for symbol in unique_symbols[order]
+    ]
+
+    structure = orm.StructureData()
+    structure.cell = np.asarray(cell, dtype=float).tolist()
+    structure.pbc = [bool(value) for value in pbc]
+    structure.base.attributes.set("kinds", kinds)
+    structure.base.attributes.set(
+        "sites",
+        [
+            {"kind_name": kind_name, "position": position}
+            for kind_name, position in zip(
+                unique_symbols[inverse.reshape(-1)].tolist(),
+                np.asarray(positions, dtype=float).tolist(),
+            )
+        ],
+    )
+    return structure
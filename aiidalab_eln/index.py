@@ -0,0 +1,190 @@
+"""Module that defines a local, searchable index of ELN entries."""
+
+import contextlib
+import json
+import os
+import sqlite3
+
+INDEX_PATH = os.path.join(os.path.expanduser("~"), ".aiidalab-eln", "index.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    eln_instance TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    identifier TEXT NOT NULL,
+    name TEXT,
+    properties TEXT,
+    attachments TEXT,
+    modified TEXT,
+    PRIMARY KEY (eln_instance, identifier)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    identifier, name, properties, attachments
+);
+CREATE TABLE IF NOT EXISTS refresh_state (
+    eln_instance TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    last_modified TEXT,
+    PRIMARY KEY (eln_instance, kind)
+);
+"""
+
+
+class ElnIndex:
+    """Local SQLite index of the samples, experiments and attachments of an ELN.
+
+    Entries are refreshed incrementally by the connectors and can be searched by
+    full text (SQLite FTS5) and by property values without contacting the server.
+    """
+
+    def __init__(self, eln_instance: str, path: str = INDEX_PATH):
+        """Open (and create, if needed) the index.
+
+        Args:
+            eln_instance (str): URL of the ELN instance whose entries are indexed.
+            path (str): Path of the SQLite database.
+        """
+        self.eln_instance = eln_instance
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_last_modified(self, kind: str):
+        """Return the latest modification date of the indexed entries of a kind."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT last_modified FROM refresh_state"
+                " WHERE eln_instance = ? AND kind = ?",
+                (self.eln_instance, kind),
+            ).fetchone()
+        return row[0] if row else None
+
+    def upsert(self, kind: str, entries, last_modified: str = None):
+        """Add or update entries of a kind.
+
+        Args:
+            kind (str): Entry kind, e.g. "sample", "experiment" or "dataset".
+            entries (list): Dictionaries with the keys "identifier", "name",
+                "properties", "attachments" and "modified".
+            last_modified (str): Modification date up to which the index is now
+                up to date, used for the next incremental refresh.
+        """
+        with self._connect() as connection:
+            for entry in entries:
+                values = (
+                    entry.get("name") or "",
+                    json.dumps(entry.get("properties") or {}, default=str),
+                    json.dumps(entry.get("attachments") or [], default=str),
+                )
+                row = connection.execute(
+                    "SELECT rowid, name, properties, attachments FROM entries"
+                    " WHERE eln_instance = ? AND identifier = ?",
+                    (self.eln_instance, entry["identifier"]),
+                ).fetchone()
+                if row is not None and tuple(row[1:]) == values:
+                    continue
+                if row is not None:
+                    connection.execute(
+                        "DELETE FROM entries_fts WHERE rowid = ?", (row[0],)
+                    )
+                    connection.execute("DELETE FROM entries WHERE rowid = ?", (row[0],))
+                cursor = connection.execute(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        self.eln_instance,
+                        kind,
+                        entry["identifier"],
+                        *values,
+                        entry.get("modified"),
+                    ),
+                )
+                connection.execute(
+                    "INSERT INTO entries_fts (rowid, identifier, name, properties,"
+                    " attachments) VALUES (?, ?, ?, ?, ?)",
+                    (cursor.lastrowid, entry["identifier"], *values),
+                )
+            if last_modified is not None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO refresh_state VALUES (?, ?, ?)",
+                    (self.eln_instance, kind, last_modified),
+                )
+
+    def _where(self, text, kind, properties):
+        clauses = ["entries.eln_instance = ?"]
+        parameters = [self.eln_instance]
+        if text:
+            # Every word has to match, as a prefix, in any of the indexed columns.
+            query = " ".join(
+                '"{}"*'.format(word.replace('"', '""')) for word in text.split()
+            )
+            clauses.append(
+                "entries.rowid IN"
+                " (SELECT rowid FROM entries_fts WHERE entries_fts MATCH ?)"
+            )
+            parameters.append(query)
+        if kind:
+            clauses.append("entries.kind = ?")
+            parameters.append(kind)
+        for key, value in (properties or {}).items():
+            clauses.append("json_extract(entries.properties, ?) = ?")
+            parameters += [f'$."{key}"', value]
+        return " AND ".join(clauses), parameters
+
+    def search(
+        self,
+        text: str = "",
+        kind: str = None,
+        properties: dict = None,
+        limit: int = 20,
+        offset: int = 0,
+    ):
+        """Search the index.
+
+        Args:
+            text (str): Words to look for in the identifiers, names, properties and
+                attachments.
+            kind (str): Only return entries of this kind.
+            properties (dict): Property values the entries must have.
+            limit (int): Maximum number of entries returned (page size).
+            offset (int): Number of entries to skip (for pagination).
+        Returns:
+            list: Dictionaries describing the matching entries.
+        """
+        where, parameters = self._where(text, kind, properties)
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT kind, identifier, name, properties, attachments, modified"
+                f" FROM entries WHERE {where}"
+                " ORDER BY modified DESC, identifier LIMIT ? OFFSET ?",
+                (*parameters, limit, offset),
+            ).fetchall()
+        return [
+            {
+                "kind": row[0],
+                "identifier": row[1],
+                "name": row[2],
+                "properties": json.loads(row[3]),
+                "attachments": json.loads(row[4]),
+                "modified": row[5],
+            }
+            for row in rows
+        ]
+
+    def count(self, text: str = "", kind: str = None, properties: dict = None):
+        """Count the entries matching a search, see `search`."""
+        where, parameters = self._where(text, kind, properties)
+        with self._connect() as connection:
+            return connection.execute(
+                f"SELECT COUNT(*) FROM entries WHERE {where}", parameters
+            ).fetchone()[0]
@@ -1,6 +1,10 @@
+import collections
+import concurrent.futures
+import hashlib
 import json
 import os
 import shutil
+import tempfile
 
 import aiidalab_widgets_base as awb
 import ase
@@ -14,6 +18,33 @@ from rdkit import Chem
 from rdkit.Chem import AllChem
 
 from ..base_connector import ElnConnector
+from ..profiling import profiled
+from ..throttle import ThrottledProxy
+from .archive import create_slim_archive
+from .geometry import get_geoopt_trajectory, structure_to_arrays, write_npz
+from .preview import create_preview_zip
+from .upload import UPLOAD_DIRECTORY, ChunkedUpload
+
+# Methods of the pybis session that send requests to openBIS. Constructors of new
+# entities, e.g. `new_sample`, only create local objects and are not throttled.
+OPENBIS_NETWORK_METHODS = (
+    "set_token",
+    "is_token_valid",
+    "is_session_active",
+    "get_server_information",
+    "get_datastores",
+    "get_sample",
+    "get_samples",
+    "get_object",
+    "get_objects",
+    "get_experiment",
+    "get_experiments",
+    "get_collection",
+    "get_collections",
+    "get_dataset",
+    "get_datasets",
+    "_post_request_full_url",
+)
 
 
 def import_smiles(smiles, steps=1000):
@@ -35,8 +66,11 @@ def import_smiles(smiles, steps=1000):
     natoms = mol.GetNumAtoms()
     species = [mol.GetAtomWithIdx(j).GetSymbol() for j in range(natoms)]
 
+    # Align the principal axes of the molecule with the Cartesian axes.
+    positions = positions - positions.mean(axis=0)
+    positions = positions @ np.linalg.svd(positions, full_matrices=False)[2].T
+
     # Make an ASE Atoms object.
-    positions = PCA(n_components=3).fit_transform(positions)
     atoms = ase.Atoms(species, positions=positions, pbc=True)
     atoms.cell = np.ptp(atoms.positions, axis=0) + 10
     atoms.center()
@@ -63,6 +97,38 @@ def get_molecule_cdxml(session, molecule_permid):
                 return structure_cdxml
 
 
+_CDXML_CACHE_SIZE = 16
+_cdxml_cache = collections.OrderedDict()
+
+
+def parse_cdxml(cdxml_widget, cdxml_content):
+    """Parse a CDXML string once, memoized by content hash.
+    Args:
+        cdxml_widget (CdxmlUploadWidget): Widget providing the CDXML parsers.
+        cdxml_content (str): Content of the CDXML file.
+    Returns:
+        tuple: ASE atoms, crossing points, CDXML atoms and whether the
+        number of units is fixed.
+    """
+    digest = hashlib.sha256(cdxml_content.encode("utf8")).hexdigest()
+    if digest in _cdxml_cache:
+        _cdxml_cache.move_to_end(digest)
+    else:
+        atoms = cdxml_widget.cdxml_to_ase_from_string(cdxml_content)
+        (
+            crossing_points,
+            cdxml_atoms,
+            nunits_disabled,
+        ) = cdxml_widget.extract_crossing_and_atom_positions(cdxml_content)
+        _cdxml_cache[digest] = (atoms, crossing_points, cdxml_atoms, nunits_disabled)
+        if len(_cdxml_cache) > _CDXML_CACHE_SIZE:
+            _cdxml_cache.popitem(last=False)
+
+    atoms, crossing_points, cdxml_atoms, nunits_disabled = _cdxml_cache[digest]
+    # The widget modifies the atoms in place, so hand out a copy.
+    return atoms.copy(), crossing_points, cdxml_atoms, nunits_disabled
+
+
 class OpenbisElnConnector(ElnConnector):
     """OpenBIS ELN connector to AiiDAlab."""
 
@@ -72,10 +138,19 @@ class OpenbisElnConnector(ElnConnector):
     molecule_info = tl.Unicode()
     molecule_uuid = tl.Unicode()
     data_type = tl.Unicode()
+    # Keyword arguments of `create_slim_archive`, e.g. {"max_file_size": 10**6}.
+    archive_options = tl.Dict()
+    # Directory where large uploads are staged until they are complete.
+    upload_directory = tl.Unicode(UPLOAD_DIRECTORY)
+    # The simulations are exported to the experiment given in `sample_uuid`.
+    sample_picker_kind = "experiment"
 
     def __init__(self, **kwargs):
 
         self.session = None
+        self._openbis_cache = None
+        self._node_viewer = None
+        self.cdxml_import_widget = None
 
         eln_instance_widget = ipw.Text(
             description="ELN address:",
@@ -121,9 +196,27 @@ class OpenbisElnConnector(ElnConnector):
             **kwargs,
         )
 
+    def release_session(self):
+        """Drop the openBIS session together with the entities it cached.
+
+        The session is not logged out, because the token is provided by the user and
+        is used again by the next `connect`.
+        """
+        if getattr(self, "session", None) is not None:
+            self.session.clear_cache()
+        self._openbis_cache = None
+        super().release_session()
+
+    @profiled
     def connect(self):
         """Function to login to openBIS."""
-        self.session = pb.Openbis(self.eln_instance, verify_certificates=False)
+        self.release_session()
+        limiter = self.limiter
+        self.session = ThrottledProxy(
+            limiter.call(pb.Openbis, self.eln_instance, verify_certificates=False),
+            limiter,
+            OPENBIS_NETWORK_METHODS,
+        )
         self.session.set_token(self.token)
         return ""
 
@@ -138,6 +231,11 @@ class OpenbisElnConnector(ElnConnector):
             "eln_instance": self.eln_instance,
             "eln_type": self.eln_type,
             "token": self.token,
+            "max_concurrency": self.max_concurrency,
+            "max_request_rate": self.max_request_rate,
+            "archive_options": self.archive_options,
+            "upload_directory": self.upload_directory,
+            "index_path": self.index_path,
         }
 
     def request_token(self, _=None):
@@ -156,9 +254,51 @@ class OpenbisElnConnector(ElnConnector):
         return ipw.VBox(
             [
                 self.sample_uuid_widget,
+                self.sample_picker,
             ]
         )
 
+    @profiled
+    def refresh_index(self):
+        """Fetch the entries modified since the last refresh into the local index."""
+        index = self.index
+        for kind, get_entities in (
+            ("sample", self.session.get_samples),
+            ("experiment", self.session.get_experiments),
+            ("dataset", self.session.get_datasets),
+        ):
+            last_modified = index.get_last_modified(kind)
+            # The dates have a resolution of a second, entities modified in the same
+            # second as the last refresh are fetched again and skipped by `upsert`.
+            where = (
+                {"modificationDate": f">={last_modified}"} if last_modified else None
+            )
+            entities = get_entities(where=where, props=["*"]).df
+            if entities.empty:
+                continue
+
+            entries = []
+            for entity in entities.to_dict(orient="records"):
+                properties = {
+                    key: value
+                    for key, value in entity.items()
+                    if value not in (None, "") and key != "permId"
+                }
+                entries.append(
+                    {
+                        "identifier": entity["permId"],
+                        "name": entity.get("$NAME") or entity.get("identifier"),
+                        "properties": properties,
+                        "modified": str(entity["modificationDate"]),
+                    }
+                )
+            index.upsert(
+                kind,
+                entries,
+                last_modified=max(entry["modified"] for entry in entries),
+            )
+
+    @profiled
     def get_all_structures_and_geoopts(self, node):
         """Get all atomistic models that led to the one used in the simulation"""
         current_node = node
@@ -187,43 +327,47 @@ class OpenbisElnConnector(ElnConnector):
 
         return all_structures, all_geoopts
 
+    @profiled
     def import_data(self):
         """Import data object from OpenBIS ELN to AiiDAlab."""
 
         molecule_info_dict = json.loads(self.molecule_info)
 
-        node_viewer = awb.AiidaNodeViewWidget()
+        # The widgets are created once and reused by the following imports. Every
+        # import creates a structure, so a single structure viewer shows them all,
+        # instead of a new viewer (and NGL widget) per node.
+        if self._node_viewer is None:
+            self._node_viewer = awb.viewers.StructureDataViewer()
+            tl.dlink((self, "node"), (self._node_viewer, "structure"))
+
         if self.data_type == "MOLECULE":
             self.node = import_smiles(molecule_info_dict["smiles"])
-            self.input_viewer.children = [node_viewer]
-            node_viewer.node = self.node
+            self.input_viewer.children = [self._node_viewer]
 
         elif self.data_type == "REACTION_PRODUCT_CONCEPT":
-            self.cdxml_import_widget = cdxml.CdxmlUploadWidget()
-            tl.dlink(
-                (self.cdxml_import_widget, "structure"),
-                (self, "node"),
-                transform=lambda struct: (
-                    orm.StructureData(ase=struct) if struct else None
-                ),
-            )
-            tl.dlink((self, "node"), (node_viewer, "node"))
+            if self.cdxml_import_widget is None:
+                self.cdxml_import_widget = cdxml.CdxmlUploadWidget()
+                tl.dlink(
+                    (self.cdxml_import_widget, "structure"),
+                    (self, "node"),
+                    transform=lambda struct: (
+                        orm.StructureData(ase=struct) if struct else None
+                    ),
+                )
 
-            self.input_viewer.children = [node_viewer, self.cdxml_import_widget]
+            self.input_viewer.children = [
+                self._node_viewer,
+                self.cdxml_import_widget,
+            ]
 
             cdxml_content = get_molecule_cdxml(self.session, self.sample_uuid)
-            cdxml_content = cdxml_content.decode("ascii")  # To test
 
-            self.cdxml_import_widget.atoms = (
-                self.cdxml_import_widget.cdxml_to_ase_from_string(cdxml_content)
-            )
             (
+                self.cdxml_import_widget.atoms,
                 self.cdxml_import_widget.crossing_points,
                 self.cdxml_import_widget.cdxml_atoms,
                 self.cdxml_import_widget.nunits.disabled,
-            ) = self.cdxml_import_widget.extract_crossing_and_atom_positions(
-                cdxml_content
-            )
+            ) = parse_cdxml(self.cdxml_import_widget, cdxml_content)
 
             self.cdxml_import_widget._on_button_click()
 
@@ -235,6 +379,46 @@ class OpenbisElnConnector(ElnConnector):
         }
         self.node.set_extra("eln", eln_info)
 
+    def _get_cached_openbis(self, key, fetch):
+        """Fetch an openBIS entity at most once per export."""
+        if self._openbis_cache is None:
+            return fetch()
+        if key not in self._openbis_cache:
+            self._openbis_cache[key] = fetch()
+        return self._openbis_cache[key]
+
+    def _cache_openbis(self, key, entity):
+        """Remember an entity created during the current export."""
+        if self._openbis_cache is not None:
+            self._openbis_cache[key] = entity
+
+    def _cache_openbis_object(self, openbis_object):
+        """Add an object saved during the current export to the cached lookups."""
+        self._cache_openbis(("sample", openbis_object.permId), openbis_object)
+        if self._openbis_cache is None:
+            return
+        objects = self._openbis_cache.get(("objects", openbis_object.type.code))
+        if objects is not None and all(
+            cached is not openbis_object for cached in objects
+        ):
+            objects.append(openbis_object)
+
+    def get_sample_openbis(self, sample_permid):
+        return self._get_cached_openbis(
+            ("sample", sample_permid),
+            lambda: self.session.get_sample(sample_permid),
+        )
+
+    def get_experiment_openbis(self, experiment_identifier):
+        return self._get_cached_openbis(
+            ("experiment", experiment_identifier),
+            lambda: self.session.get_experiment(experiment_identifier),
+        )
+
+    def save_object_openbis(self, openbis_object):
+        self.limiter.call(openbis_object.save)
+        self._cache_openbis_object(openbis_object)
+
     def create_new_collection_openbis(
         self, project_code, collection_code, collection_type, collection_name
     ):
@@ -242,18 +426,25 @@ class OpenbisElnConnector(ElnConnector):
             project=project_code, code=collection_code, type=collection_type
         )
         collection.props["$name"] = collection_name
-        collection.save()
+        self.limiter.call(collection.save)
+        collection_identifier = f"{project_code}/{collection_code}"
+        self._cache_openbis(("collection", collection_identifier), collection)
+        self._cache_openbis(("collection_exists", collection_identifier), True)
         return collection
 
     def get_collection_openbis(self, collection_identifier):
-        return self.session.get_collection(code=collection_identifier)
+        return self._get_cached_openbis(
+            ("collection", collection_identifier),
+            lambda: self.session.get_collection(code=collection_identifier),
+        )
 
     def check_if_collection_exists(self, project_code, collection_code):
-        return (
-            self.session.get_collections(
+        return self._get_cached_openbis(
+            ("collection_exists", f"{project_code}/{collection_code}"),
+            lambda: self.session.get_collections(
                 project=project_code, code=collection_code
             ).df.empty
-            is False
+            is False,
         )
 
     def create_collection_openbis(
@@ -275,7 +466,10 @@ class OpenbisElnConnector(ElnConnector):
         return collection
 
     def get_objects_list_openbis(self, object_type):
-        return self.session.get_objects(type=object_type)
+        return self._get_cached_openbis(
+            ("objects", object_type),
+            lambda: list(self.session.get_objects(type=object_type)),
+        )
 
     def check_aiida_objects_in_openbis(self, aiida_objects, openbis_objects):
         aiida_objects_inside_openbis = []
@@ -320,17 +514,14 @@ class OpenbisElnConnector(ElnConnector):
     ):
 
         if openbis_object_type == "ATOMISTIC_MODEL":
-            # Get Structure details from AiiDA
-            structure_ase = aiida_object.get_ase()
-            # structure_ase.positions # Atoms positions
-            # structure_ase.symbols # Atoms Symbols
-            # structure.cell # Cell vectors
+            # Get Structure details from AiiDA, without building an ASE object.
+            structure_pbc = aiida_object.pbc
 
             pbc = json.dumps(
                 {
-                    "x": int(structure_ase.pbc[0]),
-                    "y": int(structure_ase.pbc[1]),
-                    "z": int(structure_ase.pbc[2]),
+                    "x": int(structure_pbc[0]),
+                    "y": int(structure_pbc[1]),
+                    "z": int(structure_pbc[2]),
                 }
             )
 
@@ -350,6 +541,32 @@ class OpenbisElnConnector(ElnConnector):
 
         return object_props
 
+    def create_arrays_dataset_openbis(self, openbis_object, file_name, arrays):
+        """Attach arrays to an openBIS object as a compressed npz dataset."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = write_npz(os.path.join(temp_dir, file_name), arrays)
+            dataset = self.session.new_dataset(
+                type="RAW_DATA",
+                files=[file_path],
+                sample=openbis_object,
+            )
+            self.limiter.call(dataset.save)
+        return dataset
+
+    def upload_dataset_openbis(self, upload, openbis_object):
+        """Upload a staged file in chunks and register it as a dataset of the object."""
+        upload.upload(self.session, self.limiter)
+        try:
+            upload.register(self.session, self.limiter, openbis_object.permId)
+        except ValueError:
+            if upload.is_uploaded:
+                # Keep the uploaded chunks, a later export retries the registration.
+                raise
+            # The files were gone from the session workspace, send them once more.
+            upload.upload(self.session, self.limiter)
+            upload.register(self.session, self.limiter, openbis_object.permId)
+        upload.cleanup()
+
     def create_atomistic_models(
         self, structures_nodes, structures_inside_openbis, collection_identifier
     ):
@@ -360,7 +577,7 @@ class OpenbisElnConnector(ElnConnector):
 
             # If the structure contains a molecule, save it as a parent of the previous atomistic model because it is the molecule that started all the simulation
             if "eln" in structure.base.extras.all:
-                selected_molecule = self.session.get_sample(
+                selected_molecule = self.get_sample_openbis(
                     structure.base.extras.all["eln"]["molecule_uuid"]
                 )
             else:
@@ -378,7 +595,12 @@ class OpenbisElnConnector(ElnConnector):
                         number_aiida_objects,
                         "ATOMISTIC_MODEL",
                     )
-                    atomistic_model.save()
+                    self.save_object_openbis(atomistic_model)
+                    self.create_arrays_dataset_openbis(
+                        atomistic_model,
+                        "atomistic_model.npz",
+                        structure_to_arrays(structure),
+                    )
                     atomistic_models.append(atomistic_model)
                 else:
                     atomistic_models.append(structure_inside_openbis[0])
@@ -387,7 +609,7 @@ class OpenbisElnConnector(ElnConnector):
         # If the atomistic model (second structure, right after the molecule) is already there, there is no need to make the connection, because in principle it already contains it
         if selected_molecule is not None and structures_inside_openbis[1][1] is False:
             atomistic_models[0].add_parents(selected_molecule)
-            atomistic_models[0].save()
+            self.limiter.call(atomistic_models[0].save)
 
         return atomistic_models
 
@@ -415,11 +637,17 @@ class OpenbisElnConnector(ElnConnector):
                     "$name": f"GeoOpt Simulation {geoopt_index}",
                     "wfms_uuid": geoopt.uuid,
                 }
-                geoopt_model.save()
+                self.save_object_openbis(geoopt_model)
+
+                geoopt_trajectory = get_geoopt_trajectory(geoopt)
+                if geoopt_trajectory is not None:
+                    self.create_arrays_dataset_openbis(
+                        geoopt_model, "geoopt_trajectory.npz", geoopt_trajectory
+                    )
 
                 # Its plus one because there are N+1 geometries for N GeoOpts
                 atomistic_models[geoopt_index + 1].add_parents(geoopt_model)
-                atomistic_models[geoopt_index + 1].save()
+                self.limiter.call(atomistic_models[geoopt_index + 1].save)
 
                 geoopts_simulations.append(geoopt_model)
             else:
@@ -476,45 +704,74 @@ class OpenbisElnConnector(ElnConnector):
                 except Exception:
                     pass
 
-                stm_model.save()
-
-                # stm_simulation_images_zip_filename = series_plotter_inst.create_zip_link_for_openbis()
-
-                # stm_simulation_images_dataset = self.session.new_dataset(
-                #     type = "RAW_DATA",
-                #     files = [stm_simulation_images_zip_filename],
-                #     sample = stm_simulation_model
-                # )
-                # stm_simulation_images_dataset.save()
+                self.save_object_openbis(stm_model)
 
-                # TODO: How to do this using Python commands?
-                stm_simulation_dataset_filename = "stm_simulation.aiida"
-                os.system(
-                    f"verdi archive create {stm_simulation_dataset_filename} --no-call-calc-backward --no-call-work-backward --no-create-backward -N {stm.pk}"
-                )
-
-                stm_simulation_dataset = self.session.new_dataset(
-                    type="RAW_DATA",
-                    files=[stm_simulation_dataset_filename],
-                    sample=stm_model,
+                # Lightweight preview images, so that the results can be seen
+                # without downloading the whole archive.
+                with tempfile.TemporaryDirectory() as temp_dir:
+                    stm_simulation_images_zip_filename = create_preview_zip(
+                        stm, os.path.join(temp_dir, "stm_simulation_preview.zip")
+                    )
+                    if stm_simulation_images_zip_filename is not None:
+                        stm_simulation_images_dataset = self.session.new_dataset(
+                            type="RAW_DATA",
+                            files=[stm_simulation_images_zip_filename],
+                            sample=stm_model,
+                        )
+                        self.limiter.call(stm_simulation_images_dataset.save)
+
+                # The archive is kept with an upload manifest until the upload is
+                # complete, so that an interrupted upload can be resumed.
+                stm_simulation_upload = ChunkedUpload(
+                    stm.uuid, directory=self.upload_directory
                 )
-                stm_simulation_dataset.save()
-
-                # Delete the file after uploading
-                os.remove(stm_simulation_dataset_filename)
+                if not stm_simulation_upload.is_pending:
+                    stm_simulation_upload.prepare(
+                        create_slim_archive(
+                            stm, "stm_simulation.aiida", **self.archive_options
+                        )
+                    )
+                self.upload_dataset_openbis(stm_simulation_upload, stm_model)
 
                 stms_simulations.append(stm_model)
             else:
+                # Resume the upload of the archive if it was interrupted.
+                stm_simulation_upload = ChunkedUpload(
+                    stm.uuid, directory=self.upload_directory
+                )
+                if stm_simulation_upload.is_pending:
+                    self.upload_dataset_openbis(
+                        stm_simulation_upload, stm_inside_openbis[0]
+                    )
                 stms_simulations.append(stm_inside_openbis[0])
 
         return stms_simulations
 
+    @profiled
     def export_data(self):
         """Export AiiDA object (node attribute of this class) to ELN."""
 
-        # Get experiment from openBIS
-        selected_experiment = self.session.get_experiment(self.sample_uuid)
-
+        # Every openBIS entity is fetched at most once during a single export.
+        self._openbis_cache = {}
+        try:
+            self._export_data()
+        finally:
+            self._openbis_cache = None
+
+    def prefetch_openbis(self, calls, local_task):
+        """Run independent openBIS reads concurrently while `local_task` runs.
+        Args:
+            calls (list): Tuples of a lookup method followed by its arguments.
+            local_task (callable): Local work overlapped with the remote reads.
+        Returns:
+            tuple: Result of `local_task` and the list of lookup results.
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(calls)) as executor:
+            futures = [executor.submit(*call) for call in calls]
+            local_result = local_task()
+            return local_result, [future.result() for future in futures]
+
+    def _export_data(self):
         # Create a collection for storing atomistic models in openBIS if it is not already there
         inventory_project_code = "/MATERIALS/ATOMISTIC_MODELS"
         atomistic_models_collection_name = "Atomistic Models"
@@ -524,9 +781,31 @@ class OpenbisElnConnector(ElnConnector):
             f"{inventory_project_code}/{atomistic_models_collection_code}"
         )
 
-        atomistic_models_collection_exists = self.check_if_collection_exists(
-            inventory_project_code, atomistic_models_collection_code
+        # Fetch the experiment, the collection and the existing objects from openBIS
+        # concurrently, while getting all structures and GeoOpts from AiiDA.
+        prefetch_calls = [
+            (self.get_experiment_openbis, self.sample_uuid),
+            (
+                self.check_if_collection_exists,
+                inventory_project_code,
+                atomistic_models_collection_code,
+            ),
+            (self.get_objects_list_openbis, "GEOMETRY_OPTIMISATION"),
+            (self.get_objects_list_openbis, "ATOMISTIC_MODEL"),
+        ]
+        if isinstance(self.node, orm.WorkChainNode):
+            prefetch_calls.append((self.get_objects_list_openbis, "STM"))
+
+        (all_structures, all_aiida_geoopts), prefetched = self.prefetch_openbis(
+            prefetch_calls, lambda: self.get_all_structures_and_geoopts(self.node)
         )
+        (
+            selected_experiment,
+            atomistic_models_collection_exists,
+            geoopts_openbis,
+            atomistic_models_openbis,
+        ) = prefetched[:4]
+
         _ = self.create_collection_openbis(
             inventory_project_code,
             atomistic_models_collection_name,
@@ -535,15 +814,6 @@ class OpenbisElnConnector(ElnConnector):
             atomistic_models_collection_exists,
         )
 
-        # Get all geoopts and atomistic models from openbis
-        geoopts_openbis = self.get_objects_list_openbis("GEOMETRY_OPTIMISATION")
-        atomistic_models_openbis = self.get_objects_list_openbis("ATOMISTIC_MODEL")
-
-        # Get Geometry Optimisation Workchain from AiiDA
-        all_structures, all_aiida_geoopts = self.get_all_structures_and_geoopts(
-            self.node
-        )
-
         # Verify which GeoOpts are already in openBIS
         all_aiida_geoopts, all_geoopts_inside_openbis = (
             self.check_aiida_objects_in_openbis(all_aiida_geoopts, geoopts_openbis)
@@ -579,7 +849,7 @@ class OpenbisElnConnector(ElnConnector):
             # Get structure used in the Workchain
             all_aiida_stms = [self.node]
 
-            # Get all STMs inside openBIS
+            # Get all STMs inside openBIS (already prefetched)
             stms_openbis = self.get_objects_list_openbis("STM")
 
             # Verify which structures (atomistic models) are already in openBIS
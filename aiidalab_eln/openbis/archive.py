@@ -0,0 +1,184 @@
+"""Module to create slimmed AiiDA archives for openBIS datasets."""
+
+import fnmatch
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import zipfile
+
+from aiida.tools.archive import create_archive
+
+DB_FILENAME = "db.sqlite3"
+META_FILENAME = "metadata.json"
+REPO_FOLDER = "repo"
+
+
+def _prune_repository_metadata(metadata, keep_file, path=""):
+    """Remove the files rejected by `keep_file` from a node repository tree."""
+    objects = {}
+    for name, entry in metadata.get("o", {}).items():
+        entry_path = f"{path}{name}"
+        if "k" in entry:
+            if keep_file(entry_path, entry["k"]):
+                objects[name] = entry
+        else:
+            objects[name] = _prune_repository_metadata(
+                entry, keep_file, f"{entry_path}/"
+            )
+    return {"o": objects} if objects else {}
+
+
+def _referenced_keys(metadata):
+    """Yield the repository keys referenced by a node repository tree."""
+    for entry in metadata.get("o", {}).values():
+        if "k" in entry:
+            yield entry["k"]
+        else:
+            yield from _referenced_keys(entry)
+
+
+def _slim_database(database, keep_file, exclude_node_types):
+    """Drop excluded nodes and repository files from the archive database.
+    Returns:
+        set: Repository keys that are still referenced by the remaining nodes.
+    """
+    connection = sqlite3.connect(database)
+    try:
+        cursor = connection.cursor()
+        for node_type in exclude_node_types:
+            node_ids = [
+                row[0]
+                for row in cursor.execute(
+                    "SELECT id FROM db_dbnode WHERE node_type LIKE ?",
+                    (f"{node_type}%",),
+                )
+            ]
+            for node_id in node_ids:
+                cursor.execute(
+                    "DELETE FROM db_dblink WHERE input_id = ? OR output_id = ?",
+                    (node_id, node_id),
+                )
+                for table in ("db_dbcomment", "db_dblog", "db_dbgroup_dbnodes"):
+                    cursor.execute(
+                        f"DELETE FROM {table} WHERE dbnode_id = ?", (node_id,)
+                    )
+                cursor.execute("DELETE FROM db_dbnode WHERE id = ?", (node_id,))
+
+        keys = set()
+        rows = cursor.execute(
+            "SELECT id, repository_metadata FROM db_dbnode"
+        ).fetchall()
+        for node_id, repository_metadata in rows:
+            metadata = json.loads(repository_metadata) if repository_metadata else {}
+            metadata = _prune_repository_metadata(metadata, keep_file)
+            cursor.execute(
+                "UPDATE db_dbnode SET repository_metadata = ? WHERE id = ?",
+                (json.dumps(metadata), node_id),
+            )
+            keys.update(_referenced_keys(metadata))
+        connection.commit()
+    finally:
+        connection.close()
+    return keys
+
+
+def create_slim_archive(
+    node,
+    filename,
+    max_file_size=None,
+    include=None,
+    exclude=None,
+    exclude_node_types=(),
+    metadata_only=False,
+    compression=6,
+):
+    """Create an AiiDA archive of a node with only the repository files that are needed.
+    Args:
+        node (Node): AiiDA node to archive, e.g. an STM workchain.
+        filename (str): Path of the archive to create.
+        max_file_size (int): Repository files larger than this (in bytes) are left out.
+        include (list): Glob patterns, only matching repository files are kept.
+        exclude (list): Glob patterns of repository files to leave out.
+        exclude_node_types (list): Node type prefixes, e.g. "data.core.folder.",
+            of nodes to leave out of the archive.
+        metadata_only (bool): Leave out all repository files.
+        compression (int): Zip compression level, from 0 to 9.
+    Returns:
+        str: Path of the created archive.
+    """
+    slim = (
+        max_file_size is not None
+        or include
+        or exclude
+        or exclude_node_types
+        or metadata_only
+    )
+    # `create_archive` cannot filter the repository files, so a slim archive is
+    # written uncompressed first and only the kept files are compressed when it is
+    # rewritten.
+    create_archive(
+        [node],
+        filename=filename,
+        overwrite=True,
+        compression=0 if slim else compression,
+        create_backward=False,
+        call_calc_backward=False,
+        call_work_backward=False,
+    )
+    if not slim:
+        return filename
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        slim_filename = os.path.join(temp_dir, "slim.aiida")
+        with zipfile.ZipFile(filename) as archive:
+            file_sizes = {info.filename: info.file_size for info in archive.infolist()}
+
+            def keep_file(path, key):
+                if metadata_only:
+                    return False
+                size = file_sizes.get(f"{REPO_FOLDER}/{key}", 0)
+                if max_file_size is not None and size > max_file_size:
+                    return False
+                if include and not any(
+                    fnmatch.fnmatch(path, pattern) for pattern in include
+                ):
+                    return False
+                return not any(
+                    fnmatch.fnmatch(path, pattern) for pattern in exclude or ()
+                )
+
+            database = archive.extract(DB_FILENAME, path=temp_dir)
+            keys = _slim_database(database, keep_file, exclude_node_types)
+
+            with zipfile.ZipFile(
+                slim_filename,
+                "w",
+                compression=zipfile.ZIP_DEFLATED if compression else zipfile.ZIP_STORED,
+                compresslevel=compression if compression else None,
+            ) as slim_archive:
+                for info in archive.infolist():
+                    if info.filename == DB_FILENAME:
+                        slim_archive.write(database, DB_FILENAME)
+                    elif info.filename.startswith(f"{REPO_FOLDER}/"):
+                        key = info.filename[len(REPO_FOLDER) + 1 :]
+                        if not key or key in keys:
+                            with archive.open(info) as source, slim_archive.open(
+                                info.filename, "w"
+                            ) as target:
+                                shutil.copyfileobj(source, target)
+                    elif info.filename == META_FILENAME:
+                        metadata = json.loads(archive.read(info))
+                        metadata["compression"] = compression
+                        slim_archive.writestr(META_FILENAME, json.dumps(metadata))
+                    else:
+                        slim_archive.writestr(
+                            info,
+                            archive.read(info),
+                            compress_type=slim_archive.compression,
+                            compresslevel=slim_archive.compresslevel,
+                        )
+
+        shutil.move(slim_filename, filename)
+    return filename
@@ -0,0 +1,73 @@
+"""Module to write compact geometry datasets for openBIS objects."""
+
+import numpy as np
+from aiida import orm
+
+
+def structure_to_arrays(structure):
+    """Read the geometry of a StructureData node straight from its attributes.
+    Args:
+        structure (StructureData): AiiDA structure.
+    Returns:
+        dict: Cell, periodic boundary conditions, positions and symbols as NumPy arrays.
+    """
+    attributes = structure.base.attributes.all
+    kind_symbols = {
+        kind["name"]: kind["symbols"][0] if len(kind["symbols"]) == 1 else kind["name"]
+        for kind in attributes["kinds"]
+    }
+    sites = attributes["sites"]
+    return {
+        "cell": np.array(attributes["cell"], dtype=float),
+        "pbc": np.array(
+            [attributes["pbc1"], attributes["pbc2"], attributes["pbc3"]], dtype=bool
+        ),
+        "positions": np.array([site["position"] for site in sites], dtype=float),
+        "symbols": np.array([kind_symbols[site["kind_name"]] for site in sites]),
+    }
+
+
+def get_geoopt_trajectory(geoopt):
+    """Collect the trajectory of a geometry optimisation into stacked arrays.
+    Args:
+        geoopt (WorkChainNode): GeoOpt workchain.
+    Returns:
+        dict: Stacked positions (and cells, if available) and symbols, or None if
+        the workchain produced no trajectory.
+    """
+    # The calculations may be called by base or restart workchains of the GeoOpt.
+    calcjob_pks = [
+        node.pk
+        for node in geoopt.called_descendants
+        if isinstance(node, orm.CalcJobNode)
+    ]
+    if not calcjob_pks:
+        return None
+
+    query = (
+        orm.QueryBuilder()
+        .append(orm.CalcJobNode, filters={"id": {"in": calcjob_pks}}, tag="calcjob")
+        .append(orm.TrajectoryData, with_incoming="calcjob")
+        .order_by({orm.TrajectoryData: {"ctime": "asc"}})
+    )
+    trajectories = query.all(flat=True)
+    if not trajectories:
+        return None
+
+    arrays = {
+        "positions": np.concatenate(
+            [trajectory.get_array("positions") for trajectory in trajectories]
+        ),
+        "symbols": np.array(trajectories[-1].symbols),
+    }
+    if all("cells" in trajectory.get_arraynames() for trajectory in trajectories):
+        arrays["cells"] = np.concatenate(
+            [trajectory.get_array("cells") for trajectory in trajectories]
+        )
+    return arrays
+
+
+def write_npz(file_path, arrays):
+    """Write arrays to a compressed NumPy archive."""
+    np.savez_compressed(file_path, **arrays)
+    return file_path
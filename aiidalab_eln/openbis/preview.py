@@ -0,0 +1,102 @@
+"""Module to render lightweight preview images of STM and orbital simulations."""
+
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+from aiida import orm
+from matplotlib import image
+
+MAX_IMAGE_SIZE = 256
+MAX_IMAGES_PER_ARRAY = 16
+# Starting the rendering processes takes seconds, as they import AiiDA, while an
+# image renders in tens of milliseconds, so fewer images are rendered in-process.
+MIN_IMAGES_FOR_PROCESSES = 256
+
+
+def collect_preview_arrays(
+    node, max_size=MAX_IMAGE_SIZE, max_images_per_array=MAX_IMAGES_PER_ARRAY
+):
+    """Collect the downsampled 2D slices of the array outputs of a workchain.
+    Args:
+        node (WorkChainNode): STM or orbitals workchain.
+        max_size (int): Maximum number of pixels along each side of an image.
+        max_images_per_array (int): Maximum number of slices taken from one array.
+    Returns:
+        list: Tuples of an image name and a small 2D NumPy array.
+    """
+    images = []
+    for link in node.base.links.get_outgoing(node_class=orm.ArrayData).all():
+        for array_name in link.node.get_arraynames():
+            array = link.node.get_array(array_name)
+            if array.ndim < 2:
+                continue
+            slices = array.reshape(-1, *array.shape[-2:])
+            indices = np.unique(
+                np.linspace(
+                    0, len(slices) - 1, min(len(slices), max_images_per_array)
+                ).astype(int)
+            )
+            stride = max(1, math.ceil(max(array.shape[-2:]) / max_size))
+            for index in indices:
+                # Copy the downsampled slice, so that only it is sent to the
+                # rendering processes and the full array can be freed.
+                images.append(
+                    (
+                        f"{link.link_label}_{array_name}_{index:04d}",
+                        slices[index][::stride, ::stride].copy(),
+                    )
+                )
+    return images
+
+
+def _render_preview(array, file_path):
+    """Save a 2D array as a PNG image."""
+    image.imsave(file_path, array.T, cmap="gist_gray", origin="lower")
+    return file_path
+
+
+def create_preview_zip(node, zip_path, max_size=MAX_IMAGE_SIZE, max_workers=None):
+    """Render the preview images of a workchain and pack them into a zip.
+    Args:
+        node (WorkChainNode): STM or orbitals workchain.
+        zip_path (str): Path of the zip file to create.
+        max_size (int): Maximum number of pixels along each side of an image.
+        max_workers (int): Number of processes used to render many images.
+    Returns:
+        str: Path of the zip file, or None if the workchain has no array outputs.
+    """
+    images = collect_preview_arrays(node, max_size=max_size)
+    if not images:
+        return None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if max_workers == 1 or len(images) < MIN_IMAGES_FOR_PROCESSES:
+            file_paths = [
+                _render_preview(array, os.path.join(temp_dir, f"{name}.png"))
+                for name, array in images
+            ]
+        else:
+            # Spawn the processes, forking a multi-threaded kernel can deadlock them.
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        _render_preview, array, os.path.join(temp_dir, f"{name}.png")
+                    )
+                    for name, array in images
+                ]
+                file_paths = [future.result() for future in futures]
+
+        with zipfile.ZipFile(
+            zip_path, "w", compression=zipfile.ZIP_DEFLATED
+        ) as archive:
+            for file_path in file_paths:
+                archive.write(file_path, os.path.basename(file_path))
+    return zip_path
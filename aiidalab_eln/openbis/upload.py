@@ -0,0 +1,235 @@
+"""Module to upload large files to openBIS in resumable, checksummed chunks."""
+
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import urllib.parse
+import uuid
+
+import requests
+
+SESSION_WORKSPACE = "/datastore_server/session_workspace_file_upload"
+UPLOAD_DIRECTORY = os.path.join(os.path.expanduser("~"), ".aiidalab-eln", "uploads")
+CHUNK_SIZE = 10 * 1024 * 1024
+# Wording of the openBIS errors that say the files of an upload cannot be found.
+MISSING_FILES_PATTERN = re.compile(
+    r"not exist|not found|no such|no files|empty|missing", re.IGNORECASE
+)
+
+
+def _sha256(file_object, size):
+    """Compute the SHA-256 digest of the next `size` bytes of a file."""
+    digest = hashlib.sha256()
+    while size > 0:
+        block = file_object.read(min(size, 1024 * 1024))
+        if not block:
+            break
+        digest.update(block)
+        size -= len(block)
+    return digest.hexdigest()
+
+
+class ChunkedUpload:
+    """Resumable upload of a single file to the openBIS session workspace.
+
+    The upload state is kept in a JSON manifest next to a copy of the file, so that
+    an interrupted upload can be resumed without sending the completed chunks again.
+    The session workspace belongs to a single openBIS session, so the upload starts
+    over when the session changed, e.g. after a kernel restart with a new token.
+    """
+
+    def __init__(self, key, directory=UPLOAD_DIRECTORY, chunk_size=CHUNK_SIZE):
+        """Create an upload.
+
+        Args:
+            key (str): Identifier of the upload, e.g. the UUID of the exported node.
+            directory (str): Directory where the manifest and the file are kept.
+            chunk_size (int): Size of the uploaded chunks in bytes.
+        """
+        self.key = key
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.manifest = None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as handle:
+                self.manifest = json.load(handle)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, f"{self.key}.json")
+
+    @property
+    def is_pending(self):
+        return self.manifest is not None
+
+    @property
+    def is_uploaded(self):
+        return all(chunk["done"] for chunk in self.manifest["chunks"])
+
+    @property
+    def file_path(self):
+        return os.path.join(self.directory, self.key, self.manifest["file_name"])
+
+    def _save_manifest(self):
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as handle:
+            json.dump(self.manifest, handle)
+        os.replace(temp_path, self.manifest_path)
+
+    def prepare(self, file_path):
+        """Move the file into the upload directory and split it into chunks."""
+        os.makedirs(os.path.join(self.directory, self.key), exist_ok=True)
+        file_name = os.path.basename(file_path)
+        self.manifest = {"file_name": file_name}
+        shutil.move(file_path, self.file_path)
+
+        file_size = os.path.getsize(self.file_path)
+        chunks = []
+        with open(self.file_path, "rb") as handle:
+            for start in range(0, max(file_size, 1), self.chunk_size):
+                end = min(start + self.chunk_size, file_size) - 1
+                chunks.append(
+                    {
+                        "start": start,
+                        "end": end,
+                        "sha256": _sha256(handle, end - start + 1),
+                        "done": False,
+                    }
+                )
+        self.manifest.update({"size": file_size, "chunks": chunks, "permId": None})
+        self.restart()
+
+    def restart(self, session_token=None):
+        """Forget the uploaded chunks and upload the file again under a new id."""
+        for chunk in self.manifest["chunks"]:
+            chunk["done"] = False
+        self.manifest["upload_id"] = str(uuid.uuid4())
+        self.manifest["session_token"] = session_token
+        self.manifest["registering"] = False
+        self._save_manifest()
+
+    def upload(self, session, limiter):
+        """Upload the chunks that were not sent yet."""
+        if self.manifest.get("session_token") != session.token:
+            # The chunks of another session are not in this session's workspace.
+            self.restart(session.token)
+        datastore_url = session.get_datastores()["downloadUrl"][0]
+        url_filename = "/".join(
+            [
+                self.manifest["upload_id"],
+                urllib.parse.quote(self.manifest["file_name"]),
+            ]
+        )
+        with open(self.file_path, "rb") as handle:
+            for index, chunk in enumerate(self.manifest["chunks"]):
+                if chunk["done"]:
+                    continue
+                handle.seek(chunk["start"])
+                data = handle.read(chunk["end"] - chunk["start"] + 1)
+                if hashlib.sha256(data).hexdigest() != chunk["sha256"]:
+                    raise ValueError(
+                        f"The file {self.file_path} changed since the upload started."
+                    )
+                # Raise inside the limiter, so it sees the overload responses.
+                with limiter.limit("session_workspace_file_upload"):
+                    requests.post(
+                        f"{datastore_url}{SESSION_WORKSPACE}",
+                        params={
+                            "filename": url_filename,
+                            "id": index + 1,
+                            "startByte": chunk["start"],
+                            "endByte": chunk["end"] + 1,
+                            "emptyFolder": False,
+                            "sessionID": session.token,
+                        },
+                        data=data,
+                        verify=session.verify_certificates,
+                    ).raise_for_status()
+                chunk["done"] = True
+                self._save_manifest()
+
+    def _files_missing(self, error):
+        """Whether openBIS rejected the registration because the files are gone."""
+        message = str(error)
+        return self.manifest["upload_id"] in message and bool(
+            MISSING_FILES_PATTERN.search(message)
+        )
+
+    def _find_dataset(self, session, limiter, sample_permid, dataset_type):
+        """permId of a dataset of the sample that already contains the file."""
+        datasets = session.get_datasets(sample=sample_permid, type=dataset_type)
+        for permid in datasets.df.get("permId", []):
+            dataset = session.get_dataset(permid)
+            files = limiter.call(dataset.get_dataset_files).df
+            for path, size in zip(files["path"], files["fileLength"]):
+                if (
+                    posixpath.basename(path) == self.manifest["file_name"]
+                    and size == self.manifest["size"]
+                ):
+                    return permid
+        return None
+
+    def register(self, session, limiter, sample_permid, dataset_type="RAW_DATA"):
+        """Register the uploaded file as a dataset of an openBIS sample.
+
+        If openBIS reports that the uploaded files are no longer in the session
+        workspace, the upload is restarted before the error is raised, so that the
+        next attempt sends the file again. Other errors keep the uploaded chunks.
+        The server may have created the dataset although an earlier attempt failed,
+        so the sample is searched for it before the registration is repeated.
+        """
+        if self.manifest["permId"] is None and self.manifest.get("registering"):
+            self.manifest["permId"] = self._find_dataset(
+                session, limiter, sample_permid, dataset_type
+            )
+            self._save_manifest()
+        if self.manifest["permId"] is None:
+            datastore_url = session.get_datastores()["downloadUrl"][0]
+            request = {
+                "method": "createUploadedDataSet",
+                "params": [
+                    session.token,
+                    {
+                        "@type": "dss.dto.dataset.create.UploadedDataSetCreation",
+                        "@id": "1",
+                        "typeId": {
+                            "@type": "as.dto.entitytype.id.EntityTypePermId",
+                            "@id": "2",
+                            "permId": dataset_type,
+                            "entityKind": "DATA_SET",
+                        },
+                        "sampleId": {
+                            "@type": "as.dto.sample.id.SamplePermId",
+                            "@id": "3",
+                            "permId": sample_permid,
+                        },
+                        "properties": {},
+                        "parentIds": [],
+                        "uploadId": self.manifest["upload_id"],
+                    },
+                ],
+            }
+            post_request = session._post_request_full_url  # pylint: disable=W0212
+            self.manifest["registering"] = True
+            self._save_manifest()
+            try:
+                response = post_request(
+                    urllib.parse.urljoin(datastore_url, session.dss_v3), request
+                )
+            except ValueError as error:
+                if self._files_missing(error):
+                    self.restart(self.manifest["session_token"])
+                raise
+            self.manifest["permId"] = response["permId"]
+            self._save_manifest()
+        return self.manifest["permId"]
+
+    def cleanup(self):
+        """Remove the local copy of the file and the manifest."""
+        shutil.rmtree(os.path.join(self.directory, self.key), ignore_errors=True)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+        self.manifest = None
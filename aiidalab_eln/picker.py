@@ -0,0 +1,98 @@
+"""Module that defines a widget to pick ELN entries from the local index."""
+
+import math
+
+import ipywidgets as ipw
+import traitlets
+
+
+class ElnEntryPicker(ipw.VBox):
+    """Paginated picker of the entries stored in a local ELN index.
+
+    Only the page that is shown is loaded from the index, so browsing thousands of
+    entries stays fast. The identifier of the selected entry is stored in `value`.
+    """
+
+    value = traitlets.Unicode(allow_none=True)
+
+    def __init__(self, index, refresh=None, kind=None, page_size=20, **kwargs):
+        """Create the picker.
+
+        Args:
+            index (ElnIndex): Index to browse.
+            refresh (callable): Function that refreshes the index from the ELN.
+            kind (str): Only show entries of this kind, e.g. "sample".
+            page_size (int): Number of entries shown on a page.
+        """
+        self.index = index
+        self.refresh = refresh
+        self.kind = kind
+        self.page_size = page_size
+        self.page = 0
+
+        self.search_widget = ipw.Text(
+            description="Search:",
+            placeholder="Name, identifier or property",
+            continuous_update=False,
+            style={"description_width": "initial"},
+        )
+        self.search_widget.observe(self._on_search, names="value")
+
+        self.entries_widget = ipw.Select(rows=10, layout={"width": "initial"})
+        self.entries_widget.observe(self._on_select, names="value")
+
+        self.previous_button = ipw.Button(description="Previous", icon="arrow-left")
+        self.previous_button.on_click(lambda _: self._change_page(-1))
+        self.next_button = ipw.Button(description="Next", icon="arrow-right")
+        self.next_button.on_click(lambda _: self._change_page(1))
+        self.page_label = ipw.HTML()
+
+        buttons = [self.previous_button, self.page_label, self.next_button]
+        if refresh is not None:
+            refresh_button = ipw.Button(description="Refresh", icon="refresh")
+            refresh_button.on_click(self._on_refresh)
+            buttons.append(refresh_button)
+
+        super().__init__(
+            children=[self.search_widget, self.entries_widget, ipw.HBox(buttons)],
+            **kwargs,
+        )
+        self.update()
+
+    def update(self):
+        """Load the current page of entries from the index."""
+        text = self.search_widget.value
+        number_pages = max(
+            1, math.ceil(self.index.count(text, kind=self.kind) / self.page_size)
+        )
+        self.page = min(self.page, number_pages - 1)
+        entries = self.index.search(
+            text,
+            kind=self.kind,
+            limit=self.page_size,
+            offset=self.page * self.page_size,
+        )
+        self.entries_widget.options = [
+            (f"{entry['name']} ({entry['identifier']})", entry["identifier"])
+            for entry in entries
+        ]
+        self.entries_widget.value = None
+        self.page_label.value = f"Page {self.page + 1} of {number_pages}"
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= number_pages - 1
+
+    def _change_page(self, step):
+        self.page = max(0, self.page + step)
+        self.update()
+
+    def _on_search(self, _=None):
+        self.page = 0
+        self.update()
+
+    def _on_select(self, change):
+        if change["new"] is not None:
+            self.value = change["new"]
+
+    def _on_refresh(self, _=None):
+        self.refresh()
+        self.update()
@@ -0,0 +1,99 @@
+"""Module that defines the opt-in profiling of the ELN connectors."""
+
+import contextlib
+import cProfile
+import functools
+import itertools
+import os
+import re
+import threading
+import time
+
+PROFILE_DIRECTORY_VARIABLE = "AIIDALAB_ELN_PROFILE_DIR"
+
+_state = threading.local()
+_counter = itertools.count()
+
+
+def default_profile_directory():
+    """Directory for the profiles given by the environment, empty if profiling is off."""
+    return os.environ.get(PROFILE_DIRECTORY_VARIABLE, "")
+
+
+@contextlib.contextmanager
+def profile(directory: str, operation: str):
+    """Profile the enclosed code with cProfile and dump the statistics to a file.
+
+    The statistics are written to `<directory>/<operation>-<timestamp>-<pid>-<n>.pstats`
+    and can be read with `pstats`, snakeviz or converted for speedscope. Operations
+    started while another one is profiled in the same thread are part of the outer
+    profile, so every file covers one top-level operation.
+
+    Args:
+        directory (str): Directory where the profile is written. Nothing is profiled
+            if it is empty.
+        operation (str): Name of the profiled operation, used in the file name.
+    """
+    if not directory or getattr(_state, "active", False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already running in this process (Python >= 3.12).
+        yield
+        return
+
+    _state.active = True
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _state.active = False
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^\w.-]", "_", operation)
+        profiler.dump_stats(
+            os.path.join(
+                directory,
+                f"{name}-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+                f"-{next(_counter)}.pstats",
+            )
+        )
+
+
+def profiled(method):
+    """Decorator that profiles a connector method if `profile_directory` is set."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        directory = getattr(self, "profile_directory", "")
+        if not directory:
+            return method(self, *args, **kwargs)
+        with profile(directory, f"{type(self).__name__}.{method.__name__}"):
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class ProfiledLimiter:
+    """Limiter wrapper that profiles every throttled network request."""
+
+    def __init__(self, limiter, directory: str):
+        self._limiter = limiter
+        self._directory = directory
+
+    def __getattr__(self, name):
+        return getattr(self._limiter, name)
+
+    @contextlib.contextmanager
+    def limit(self, operation="request"):
+        with profile(self._directory, f"network.{operation}"):
+            with self._limiter.limit(operation):
+                yield
+
+    def call(self, function, *args, **kwargs):
+        name = getattr(function, "__qualname__", type(function).__name__)
+        with profile(self._directory, f"network.{name}"), self._limiter.limit(name):
+            return function(*args, **kwargs)
@@ -0,0 +1,197 @@
+"""Module that defines the client-side throttling shared by the ELN connectors."""
+
+import contextlib
+import re
+import threading
+import time
+
+import requests
+
+OVERLOAD_STATUS_CODES = (429, 503)
+# pybis reports HTTP errors as a plain `ValueError` with the status in its message.
+PYBIS_STATUS_PATTERN = re.compile(r"error while performing \w+ request\. (\d{3}):")
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class AdaptiveLimiter:
+    """Rate limiter and concurrency governor with AIMD adaptation.
+
+    The number of concurrent requests and the request rate grow additively while
+    the server answers normally and are halved when it signals overload: HTTP 429
+    or 503 responses, timeouts and connection errors. Slow requests that succeed
+    only stop the growth. A request counts as slow if its latency exceeds
+    `latency_tolerance` times the moving average latency of the same operation, so
+    large uploads are not compared with small RPCs.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_rate: float = 10.0,
+        latency_tolerance: float = 4.0,
+        latency_smoothing: float = 0.2,
+    ):
+        """Create a limiter.
+
+        Args:
+            max_concurrency (int): Maximum number of requests in flight.
+            max_rate (float): Maximum number of requests per second.
+            latency_tolerance (float): Latency increase, relative to the average
+                latency of the operation, that is treated as a sign of congestion.
+            latency_smoothing (float): Weight of the latest request in the moving
+                average latency of an operation.
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_rate = max(0.1, max_rate)
+        self.latency_tolerance = latency_tolerance
+        self.latency_smoothing = latency_smoothing
+
+        self.concurrency = float(self.max_concurrency)
+        self.rate = self.max_rate
+        self._in_flight = 0
+        self._next_slot = 0.0
+        self._latencies = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def configure(self, max_concurrency: int = None, max_rate: float = None):
+        """Update the upper limits, e.g. after the connector config changed."""
+        with self._condition:
+            if max_concurrency is not None:
+                self.max_concurrency = max(1, max_concurrency)
+                self.concurrency = min(self.concurrency, self.max_concurrency)
+            if max_rate is not None:
+                self.max_rate = max(0.1, max_rate)
+                self.rate = min(self.rate, self.max_rate)
+            self._condition.notify_all()
+
+    def _acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self.concurrency):
+                self._condition.wait()
+            self._in_flight += 1
+
+            # Space the requests according to the current rate.
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            self._next_slot = start + 1.0 / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+    def _release(self, operation, latency, overloaded):
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                # Decrease at most once per round trip, so a burst of failing
+                # requests that were already in flight counts as a single signal.
+                if now - self._last_decrease > latency:
+                    self.concurrency = max(1.0, self.concurrency / 2)
+                    self.rate = max(0.1, self.rate / 2)
+                    self._last_decrease = now
+            else:
+                average = self._latencies.get(operation, latency)
+                if latency <= self.latency_tolerance * average:
+                    self.concurrency = min(
+                        float(self.max_concurrency),
+                        self.concurrency + 1 / self.concurrency,
+                    )
+                    self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+                self._latencies[operation] = (
+                    1 - self.latency_smoothing
+                ) * average + self.latency_smoothing * latency
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def limit(self, operation: str = "request"):
+        """Context manager that wraps a single network request.
+
+        Args:
+            operation (str): Kind of request, requests of the same kind are expected
+                to take a similar time.
+        """
+        self._acquire()
+        start = time.monotonic()
+        overloaded = False
+        try:
+            yield
+        except Exception as error:
+            overloaded = is_overload_error(error)
+            raise
+        finally:
+            self._release(operation, time.monotonic() - start, overloaded)
+
+    def call(self, function, *args, **kwargs):
+        """Call `function` as a throttled network request."""
+        operation = getattr(function, "__qualname__", type(function).__name__)
+        with self.limit(operation):
+            return function(*args, **kwargs)
+
+
+def is_overload_error(error):
+    """Whether an error or its cause signals an overloaded or unreachable server."""
+    while error is not None:
+        if _is_overload_error(error):
+            return True
+        error = error.__cause__
+    return False
+
+
+def _is_overload_error(error):
+    if isinstance(
+        error,
+        (
+            TimeoutError,
+            ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.ConnectionError,
+        ),
+    ):
+        return True
+    response = getattr(error, "response", None)
+    status_code = getattr(response, "status_code", None)
+    if status_code is None and isinstance(error, ValueError):
+        match = PYBIS_STATUS_PATTERN.search(str(error))
+        status_code = int(match.group(1)) if match else None
+    return status_code in OVERLOAD_STATUS_CODES
+
+
+class ThrottledProxy:
+    """Proxy that routes the network methods of the wrapped object through a limiter.
+
+    All other attributes, e.g. constructors of local objects, are passed through.
+    """
+
+    def __init__(self, wrapped, limiter: AdaptiveLimiter, network_methods):
+        """Create a proxy.
+
+        Args:
+            wrapped (object): Object to proxy, e.g. an ELN session.
+            limiter (AdaptiveLimiter): Limiter of the ELN instance.
+            network_methods (iterable): Names of the methods that send requests.
+        """
+        self._wrapped = wrapped
+        self._limiter = limiter
+        self._network_methods = frozenset(network_methods)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._wrapped, name)
+        if name not in self._network_methods:
+            return attribute
+
+        def throttled(*args, **kwargs):
+            return self._limiter.call(attribute, *args, **kwargs)
+
+        return throttled
+
+
+def get_limiter(eln_instance: str, max_concurrency: int = None, max_rate: float = None):
+    """Provide the limiter shared by all connectors talking to `eln_instance`."""
+    with _limiters_lock:
+        if eln_instance not in _limiters:
+            _limiters[eln_instance] = AdaptiveLimiter()
+        limiter = _limiters[eln_instance]
+    limiter.configure(max_concurrency=max_concurrency, max_rate=max_rate)
+    return limiter
@@ -0,0 +1,108 @@
+"""Check that the ELN limiters back off when the server signals overload.
+
+Sends requests through the throttled openBIS and cheminfo sessions to a local
+server that answers every request with HTTP 429 or 503, and exits with a non-zero
+status unless the first of them halves the concurrency and the rate limits:
+
+    python benchmarks/overload.py
+"""
+
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+
+class OverloadedHandler(BaseHTTPRequestHandler):
+    """Server that is always overloaded, with the status code set by `status`."""
+
+    status = 503
+
+    def _reply_ok(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "7")
+        self.end_headers()
+        self.wfile.write(b'["eln"]')
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # cheminfopy checks the instance URL before any other request and only
+        # reports that the check failed, let it pass to reach the throttled ones.
+        if self.path.startswith("/db/_all_dbs"):
+            self._reply_ok()
+            return
+        self.send_response(self.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = do_POST = do_PUT = _reply
+
+
+def openbis_requests(url, limiter):
+    """Send JSON-RPC requests through a throttled pybis session."""
+    import pybis
+
+    from aiidalab_eln.openbis import OPENBIS_NETWORK_METHODS
+    from aiidalab_eln.throttle import ThrottledProxy
+
+    session = pybis.Openbis(
+        url,
+        use_cache=False,
+        allow_http_but_do_not_use_this_in_production_and_only_within_safe_networks=True,
+    )
+    session = ThrottledProxy(session, limiter, OPENBIS_NETWORK_METHODS)
+    try:
+        session.set_token("overload-token")
+    except ValueError:
+        pass
+
+
+def cheminfo_requests(url, _):
+    """Check the token of a cheminfo connector, which hides the HTTP errors."""
+    from aiidalab_eln import CheminfoElnConnector
+
+    with CheminfoElnConnector(eln_instance=url, token="overload-token") as connector:
+        connector.connect()
+        assert not connector.is_connected
+
+
+def main():
+    from aiidalab_eln.throttle import AdaptiveLimiter, get_limiter
+
+    failed = False
+    for status in (429, 503):
+        OverloadedHandler.status = status
+        server = ThreadingHTTPServer(("127.0.0.1", 0), OverloadedHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+        try:
+            for name, send, limiter in (
+                ("openbis", openbis_requests, AdaptiveLimiter()),
+                # The connector uses the limiter shared for its ELN instance.
+                ("cheminfo", cheminfo_requests, get_limiter(url)),
+            ):
+                concurrency, rate = limiter.concurrency, limiter.rate
+                send(url, limiter)
+                halved = (
+                    limiter.concurrency <= concurrency / 2 and limiter.rate <= rate / 2
+                )
+                failed = failed or not halved
+                print(
+                    f"{name} {status}: concurrency {concurrency} -> "
+                    f"{limiter.concurrency}, rate {rate} -> {limiter.rate}"
+                    f"{'' if halved else ', limits were not halved'}"
+                )
+        except requests.exceptions.RequestException as error:
+            failed = True
+            print(f"{status}: unexpected error {error!r}")
+        finally:
+            server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,590 @@
+"""Soak test of the ELN connectors for long-lived kernels.
+
+Runs many connect/import/export cycles against local stand-in servers of the ELNs
+and tracks the resident memory, the open sockets, the number of live widgets and the
+Python heap growth (tracemalloc). The script exits with a non-zero status if any of
+them keeps growing after the warm-up cycles.
+
+The import and export cycles create AiiDA nodes, so they need an AiiDA profile:
+
+    python benchmarks/soak.py --cycles 2000 --profile my-profile
+"""
+
+import argparse
+import collections
+import gc
+import itertools
+import json
+import os
+import re
+import resource
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ipywidgets as ipw
+
+CIF = """data_NaCl
+_cell_length_a 5.64
+_cell_length_b 5.64
+_cell_length_c 5.64
+_cell_angle_alpha 90
+_cell_angle_beta 90
+_cell_angle_gamma 90
+_symmetry_space_group_name_H-M 'P 1'
+loop_
+_atom_site_label
+_atom_site_type_symbol
+_atom_site_fract_x
+_atom_site_fract_y
+_atom_site_fract_z
+Na1 Na 0.0 0.0 0.0
+Cl1 Cl 0.5 0.5 0.5
+"""
+
+
+PERSON = {"@type": "as.dto.person.Person", "userId": "soak"}
+# Properties set by the openBIS export, every entity type is given all of them.
+PROPERTY_TYPES = {
+    "$NAME": "VARCHAR",
+    "WFMS_UUID": "VARCHAR",
+    "PERIODIC_BOUNDARY_CONDITIONS": "VARCHAR",
+    "OPTIMISED": "BOOLEAN",
+    "E_MIN": "VARCHAR",
+    "E_MAX": "VARCHAR",
+    "DE": "VARCHAR",
+}
+
+
+def search_result(objects):
+    return {"objects": objects, "totalCount": len(objects)}
+
+
+def searched_code(criteria):
+    """First value searched for in openBIS search criteria, e.g. a type code."""
+    if isinstance(criteria, dict):
+        if "value" in criteria:
+            return criteria["value"]
+        values = criteria.values()
+    elif isinstance(criteria, list):
+        values = criteria
+    else:
+        return None
+    for value in values:
+        code = searched_code(value)
+        if code is not None:
+            return code
+    return None
+
+
+def property_type_record(code):
+    return {
+        "@type": "as.dto.property.PropertyType",
+        "code": code,
+        "label": code,
+        "description": "",
+        "dataType": PROPERTY_TYPES[code],
+    }
+
+
+def type_record(dto, code):
+    """Entity type with all `PROPERTY_TYPES` assigned, e.g. dto="sample.Sample"."""
+    return {
+        "@type": f"as.dto.{dto}Type",
+        "permId": {"@type": "as.dto.entitytype.id.EntityTypePermId", "permId": code},
+        "code": code,
+        "description": "",
+        "propertyAssignments": [
+            {
+                "propertyType": property_type_record(property_code),
+                "mandatory": False,
+                "showInEditView": True,
+                "ordinal": ordinal,
+            }
+            for ordinal, property_code in enumerate(PROPERTY_TYPES)
+        ],
+        "modificationDate": 0,
+    }
+
+
+def space_record(code):
+    return {
+        "@type": "as.dto.space.Space",
+        "permId": {"@type": "as.dto.space.id.SpacePermId", "permId": code},
+        "code": code,
+    }
+
+
+def project_record(identifier):
+    """Project with an identifier like /SPACE/CODE."""
+    space, code = identifier.rsplit("/", 1)
+    return {
+        "@type": "as.dto.project.Project",
+        "permId": {"@type": "as.dto.project.id.ProjectPermId", "permId": code},
+        "identifier": {
+            "@type": "as.dto.project.id.ProjectIdentifier",
+            "identifier": identifier,
+        },
+        "code": code,
+        "space": space_record(space.strip("/")),
+        "attachments": [],
+        "registrator": PERSON,
+        "modifier": PERSON,
+        "registrationDate": 0,
+        "modificationDate": 0,
+    }
+
+
+def experiment_record(identifier):
+    """Experiment (or collection) with an identifier like /SPACE/PROJECT/CODE."""
+    project, code = identifier.rsplit("/", 1)
+    return {
+        "@type": "as.dto.experiment.Experiment",
+        "permId": {"@type": "as.dto.experiment.id.ExperimentPermId", "permId": code},
+        "identifier": {
+            "@type": "as.dto.experiment.id.ExperimentIdentifier",
+            "identifier": identifier,
+        },
+        "code": code,
+        "type": {"@type": "as.dto.experiment.ExperimentType", "code": "COLLECTION"},
+        "project": project_record(project),
+        "properties": {},
+        "tags": [],
+        "attachments": [],
+        "registrator": PERSON,
+        "modifier": PERSON,
+        "registrationDate": 0,
+        "modificationDate": 0,
+    }
+
+
+def sample_record(perm_id, type_code):
+    return {
+        "@type": "as.dto.sample.Sample",
+        "permId": {"@type": "as.dto.sample.id.SamplePermId", "permId": perm_id},
+        "identifier": {
+            "@type": "as.dto.sample.id.SampleIdentifier",
+            "identifier": f"/MATERIALS/{perm_id}",
+        },
+        "code": perm_id,
+        "type": type_record("sample.Sample", type_code),
+        "space": space_record("MATERIALS"),
+        "properties": {},
+        "parents": [],
+        "children": [],
+        "components": [],
+        "tags": [],
+        "attachments": [],
+        "dataSets": [],
+        "registrator": PERSON,
+        "modifier": PERSON,
+        "registrationDate": 0,
+        "modificationDate": 0,
+    }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the openBIS JSON-RPC and cheminfo REST APIs."""
+
+    attachments = {}
+    # Types of the recently created samples by permId, bounded to not grow the heap.
+    samples = collections.OrderedDict()
+    perm_ids = (f"20240101000000000-{number}" for number in itertools.count(1))
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _reply(self, payload, status=200):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """openBIS JSON-RPC and uploads to the session workspace.
+
+        Every session is active, searches for objects find nothing and created
+        entities are answered with minimal records, which is enough for the export.
+        Uploaded files are discarded.
+        """
+        body = self._read_body()
+        if self.path.startswith("/datastore_server/session_workspace_file_upload"):
+            self._reply({"size": len(body)})
+            return
+        request = json.loads(body or b"{}")
+        method = getattr(self, f"rpc_{request.get('method')}", None)
+        self._reply(
+            {
+                "jsonrpc": "2.0",
+                "id": request.get("id"),
+                "result": method(*request["params"][1:]) if method else None,
+            }
+        )
+
+    @staticmethod
+    def rpc_getExperiments(ids, _):  # pylint: disable=invalid-name
+        return {
+            experiment_id["identifier"]: experiment_record(experiment_id["identifier"])
+            for experiment_id in ids
+        }
+
+    @staticmethod
+    def rpc_getProjects(ids, _):  # pylint: disable=invalid-name
+        return {
+            project_id["identifier"]: project_record(project_id["identifier"])
+            for project_id in ids
+        }
+
+    @staticmethod
+    def rpc_getPropertyTypes(ids, _):  # pylint: disable=invalid-name
+        return {
+            type_id["permId"]: property_type_record(type_id["permId"])
+            for type_id in ids
+        }
+
+    @staticmethod
+    def rpc_searchExperiments(*_):  # pylint: disable=invalid-name
+        # The collection of the atomistic models exists.
+        return search_result(
+            [
+                experiment_record(
+                    "/MATERIALS/ATOMISTIC_MODELS/ATOMISTIC_MODEL_COLLECTION"
+                )
+            ]
+        )
+
+    @staticmethod
+    def rpc_searchSamples(*_):  # pylint: disable=invalid-name
+        return search_result([])
+
+    def rpc_createSamples(self, creations):  # pylint: disable=invalid-name
+        perm_ids = []
+        for creation in creations:
+            perm_id = next(self.perm_ids)
+            self.samples[perm_id] = creation["typeId"]["permId"]
+            if len(self.samples) > 100:
+                self.samples.popitem(last=False)
+            perm_ids.append({"permId": perm_id})
+        return perm_ids
+
+    def rpc_getSamples(self, ids, _):  # pylint: disable=invalid-name
+        samples = {}
+        for sample_id in ids:
+            key = sample_id.get("permId") or sample_id["identifier"]
+            perm_id = key.rsplit("/", 1)[-1]
+            samples[key] = sample_record(perm_id, self.samples[perm_id])
+        return samples
+
+    def __getattr__(self, name):
+        # Entity types, e.g. `getSampleTypes` and `searchSampleTypes`.
+        match = re.fullmatch(r"rpc_(get|search)(Experiment|Sample|DataSet)Types", name)
+        if match is None:
+            raise AttributeError(name)
+        dto = f"{match.group(2).lower()}.{match.group(2)}"
+        if match.group(1) == "get":
+            return lambda ids, _: {
+                type_id["permId"]: type_record(dto, type_id["permId"])
+                for type_id in ids
+            }
+        return lambda criteria, _: search_result(
+            [type_record(dto, searched_code(criteria))]
+        )
+
+    def rpc_searchDataStores(self, *_):  # pylint: disable=invalid-name
+        url = self.server.url.rstrip("/")
+        return search_result([{"code": "DSS", "downloadUrl": url, "remoteUrl": url}])
+
+    @staticmethod
+    def rpc_createUploadedDataSet(_):  # pylint: disable=invalid-name
+        # An empty permId, as from servers that do not return the new data set.
+        return {"permId": ""}
+
+    @staticmethod
+    def rpc_isSessionActive():  # pylint: disable=invalid-name
+        return True
+
+    @staticmethod
+    def rpc_getServerInformation():  # pylint: disable=invalid-name
+        return {"api-version": "3.6", "project-samples-enabled": "true"}
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        path = self.path.split("?")[0]
+        if path.startswith("/db/_all_dbs"):
+            self._reply(["eln"])
+        elif re.match(r"/db/eln/token/", path):
+            self._reply({"$kind": "user", "rights": ["read", "write", "addAttachment"]})
+        elif "/spectra/" in path:
+            self._reply(self.attachments.get(path, CIF.encode()))
+        elif path.startswith("/db/eln/entry/"):
+            self._reply({"_id": "sample", "_rev": "1", "$content": {"spectra": {}}})
+        elif path.startswith("/db/eln/_query/sample_toc"):
+            self._reply([])
+        else:
+            self._reply({}, status=404)
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        body = self._read_body()
+        path = self.path.split("?")[0]
+        if "/spectra/" in path:
+            self.attachments[path] = body
+        self._reply({"ok": True})
+
+
+def start_stand_in_server(tls=False):
+    """Start the stand-in server in a background thread and return its URL.
+
+    pybis only talks HTTPS, so for openBIS the server uses a self-signed certificate
+    created with the openssl command line tool.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    scheme = "http"
+    if tls:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            key, certificate = (os.path.join(temp_dir, name) for name in ("key", "crt"))
+            subprocess.run(
+                ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes"]
+                + ["-keyout", key, "-out", certificate, "-days", "1"]
+                + ["-subj", "/CN=127.0.0.1"],
+                check=True,
+                capture_output=True,
+            )
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certificate, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    server.url = f"{scheme}://127.0.0.1:{server.server_address[1]}/"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.url
+
+
+def rss_bytes():
+    """Resident set size of this process."""
+    try:
+        with open("/proc/self/status") as handle:
+            for line in handle:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Peak RSS, in kilobytes on Linux and in bytes on macOS.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def open_sockets():
+    """Number of open sockets of this process (Linux only, else -1)."""
+    try:
+        file_descriptors = os.listdir("/proc/self/fd")
+    except OSError:
+        return -1
+    count = 0
+    for file_descriptor in file_descriptors:
+        try:
+            if os.readlink(f"/proc/self/fd/{file_descriptor}").startswith("socket:"):
+                count += 1
+        except OSError:
+            continue
+    return count
+
+
+def live_widgets():
+    """Number of widgets that are registered (i.e. not closed) in the kernel."""
+    registry = getattr(ipw.widgets.widget, "_instances", None)
+    if registry is None:
+        registry = ipw.Widget.widgets
+    return len(registry)
+
+
+def sample():
+    gc.collect()
+    return {
+        "rss": rss_bytes(),
+        "sockets": open_sockets(),
+        "widgets": live_widgets(),
+        "heap": tracemalloc.get_traced_memory()[0],
+    }
+
+
+def openbis_cycle(url, _, state):
+    """Create, connect and close a new openBIS connector."""
+    from aiidalab_eln import OpenbisElnConnector
+
+    with OpenbisElnConnector(eln_instance=url, token="soak-token") as connector:
+        connector.connect()
+        assert connector.is_connected
+
+
+def openbis_reconnect_cycle(url, _, state):
+    """Reconnect a long-lived openBIS connector and import a molecule with it."""
+    from aiida.manage import get_manager
+
+    from aiidalab_eln import OpenbisElnConnector
+
+    if "connector" not in state:
+        state["connector"] = OpenbisElnConnector(
+            eln_instance=url,
+            token="soak-token",
+            sample_uuid="20240101000000000-1",
+            data_type="MOLECULE",
+            molecule_info=json.dumps({"smiles": "CCO"}),
+        )
+    connector = state["connector"]
+    connector.connect()
+    assert connector.is_connected
+    connector.import_data()
+    # AiiDA keeps unstored nodes pending in its storage session until they are
+    # stored, discard the imported one as a user would by not storing it.
+    get_manager().get_profile_storage().get_session().rollback()
+
+
+def stm_workchain():
+    """Stored STM workchain of a small structure, with an array output."""
+    import numpy as np
+    from aiida import orm
+    from aiida.common.links import LinkType
+
+    structure = orm.StructureData(cell=[[5.0, 0, 0], [0, 5.0, 0], [0, 0, 5.0]])
+    structure.append_atom(position=(0, 0, 0), symbols="H")
+    structure.store()
+    workchain = orm.WorkChainNode(label="STM")
+    workchain.base.links.add_incoming(structure, LinkType.INPUT_WORK, "structure")
+    workchain.store()
+    array = orm.ArrayData()
+    array.set_array("stm", np.random.default_rng(0).random((4, 64, 64)))
+    array.store()
+    array.base.links.add_incoming(workchain, LinkType.RETURN, "stm_array")
+    workchain.seal()
+    return workchain
+
+
+def openbis_export_cycle(url, _, state):
+    """Export an STM workchain, with its structure, with a new openBIS connector."""
+    from aiidalab_eln import OpenbisElnConnector
+
+    if "node" not in state:
+        state["node"] = stm_workchain()
+        state["temp_dir"] = tempfile.TemporaryDirectory()
+    with OpenbisElnConnector(
+        eln_instance=url,
+        token="soak-token",
+        sample_uuid="/PROJECTS/SOAK/EXPERIMENT",
+        node=state["node"],
+        upload_directory=state["temp_dir"].name,
+    ) as connector:
+        connector.connect()
+        connector.export_data()
+
+
+def cheminfo_cycle(url, index, state):
+    """Connect a new cheminfo connector, import a CIF file and export it again."""
+    from aiidalab_eln import CheminfoElnConnector
+
+    with CheminfoElnConnector(
+        eln_instance=url,
+        token="soak-token",
+        sample_uuid="sample",
+        file_name="structure.cif",
+        data_type="xray",
+    ) as connector:
+        assert connector.connect() == ""
+        connector.import_data()
+        connector.file_name = f"export-{index}"
+        connector.export_data()
+
+
+CYCLES = {
+    "openbis": openbis_cycle,
+    "openbis-reconnect": openbis_reconnect_cycle,
+    "openbis-export": openbis_export_cycle,
+    "cheminfo": cheminfo_cycle,
+}
+SERVERS = {
+    "openbis": "openbis",
+    "openbis-reconnect": "openbis",
+    "openbis-export": "openbis",
+    "cheminfo": "cheminfo",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cycles", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--report-every", type=int, default=100)
+    parser.add_argument("--connectors", nargs="+", default=sorted(CYCLES))
+    parser.add_argument("--profile", help="AiiDA profile for the import cycles.")
+    parser.add_argument(
+        "--max-heap-growth",
+        type=int,
+        default=1024,
+        help="Allowed heap growth per cycle after the warm-up, in bytes.",
+    )
+    args = parser.parse_args()
+
+    if set(args.connectors) - {"openbis"}:
+        from aiida import load_profile
+
+        load_profile(args.profile)
+
+    servers = {
+        "openbis": start_stand_in_server(tls=True),
+        "cheminfo": start_stand_in_server(),
+    }
+    tracemalloc.start()
+    failed = False
+    try:
+        for name in args.connectors:
+            cycle = CYCLES[name]
+            url = servers[SERVERS[name]][1]
+            state = {}
+            for index in range(args.warmup):
+                cycle(url, index, state)
+            baseline = sample()
+            snapshot = tracemalloc.take_snapshot()
+            print(f"{name}: baseline {baseline}")
+
+            for index in range(1, args.cycles + 1):
+                cycle(url, index, state)
+                if index % args.report_every == 0 or index == args.cycles:
+                    current = sample()
+                    print(
+                        f"{name} {index:6d}: "
+                        f"rss {(current['rss'] - baseline['rss']) / 2**20:+8.2f} MiB, "
+                        f"heap {(current['heap'] - baseline['heap']) / 2**10:+9.1f} KiB, "
+                        f"sockets {current['sockets'] - baseline['sockets']:+d}, "
+                        f"widgets {current['widgets'] - baseline['widgets']:+d}"
+                    )
+
+            heap_growth = (current["heap"] - baseline["heap"]) / args.cycles
+            if (
+                current["widgets"] > baseline["widgets"]
+                or current["sockets"] > baseline["sockets"]
+                or heap_growth > args.max_heap_growth
+            ):
+                failed = True
+                print(f"{name}: resources are leaking, largest heap growth:")
+                for stat in tracemalloc.take_snapshot().compare_to(snapshot, "lineno")[
+                    :10
+                ]:
+                    print(f"    {stat}")
+            if "connector" in state:
+                state["connector"].close()
+            if "temp_dir" in state:
+                state["temp_dir"].cleanup()
+    finally:
+        tracemalloc.stop()
+        for server, _ in servers.values():
+            server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Benchmark of the StructureData construction for large PDB imports.
+
+Compares the bulk import of the cheminfo connector (`parse_pdb` followed by
+`structure_from_arrays`) with the former path through ASE,
+`StructureData(ase=ase.io.read(...))`, on synthetic protein-sized PDB files, and
+checks that both produce the same structure:
+
+    python benchmarks/structure_import.py --atoms 1000 10000 50000 --profile my-profile
+"""
+
+import argparse
+import io
+import sys
+import time
+
+import numpy as np
+
+# Atom name (columns 13-16) and element symbol (columns 77-78) of typical residues.
+ATOMS = [
+    (" N  ", "N"),
+    (" CA ", "C"),
+    (" C  ", "C"),
+    (" O  ", "O"),
+    (" CB ", "C"),
+    (" SG ", "S"),
+    (" H  ", "H"),
+    ("FE  ", "FE"),
+]
+
+
+def make_pdb(number_atoms, seed=0):
+    """Create a PDB file with randomly placed atoms in a monoclinic cell."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(0, 99, (number_atoms, 3))
+    lines = ["CRYST1  100.000  100.000  100.000  90.00 100.00  90.00 P 1           1"]
+    for index, (x, y, z) in enumerate(positions):
+        name, element = ATOMS[index % len(ATOMS)]
+        lines.append(
+            f"ATOM  {index % 100000:5d} {name} ALA A{index // 8 % 10000:4d}    "
+            f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00  0.00          {element:>2s}"
+        )
+    lines.append("END")
+    return "\n".join(lines) + "\n"
+
+
+def best_time(function, repeat):
+    """Best wall time of `repeat` calls of `function`, and its last result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--atoms", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--profile", help="AiiDA profile used to create the nodes.")
+    args = parser.parse_args()
+
+    from aiida import load_profile, orm
+    from ase.io import read
+
+    from aiidalab_eln.cheminfo.structure import parse_pdb, structure_from_arrays
+
+    load_profile(args.profile)
+
+    print(f"{'atoms':>8} {'from ASE (s)':>14} {'bulk (s)':>10} {'speed-up':>9}")
+    for number_atoms in args.atoms:
+        content = make_pdb(number_atoms)
+        ase_time, reference = best_time(
+            lambda: orm.StructureData(
+                ase=read(io.StringIO(content), format="proteindatabank")
+            ),
+            args.repeat,
+        )
+        bulk_time, structure = best_time(
+            lambda: structure_from_arrays(**parse_pdb(content)), args.repeat
+        )
+
+        assert structure.get_formula() == reference.get_formula()
+        assert np.allclose(structure.cell, reference.cell)
+        assert structure.pbc == reference.pbc
+        assert [kind.get_raw() for kind in structure.kinds] == [
+            kind.get_raw() for kind in reference.kinds
+        ]
+        assert np.allclose(
+            [site.position for site in structure.sites],
+            [site.position for site in reference.sites],
+        )
+        print(
+            f"{number_atoms:8d} {ase_time:14.3f} {bulk_time:10.3f} "
+            f"{ase_time / bulk_time:8.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())